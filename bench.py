@@ -0,0 +1,322 @@
+import argparse
+import fnmatch
+import inspect
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+from opensimplex import OpenSimplex
+
+import equations
+import terrain
+from clouds import CLOUD_STEP, CloudLayer, cloud_opacity
+
+# Headless benchmarks for the equations and the renderer. Results can be saved
+# as a JSON baseline and later runs compared against one; anything slower than
+# the baseline by more than the tolerance is a regression and fails the run.
+#
+#   python bench.py --save bench_baseline.json     record a baseline
+#   python bench.py --compare bench_baseline.json  exit 1 on a regression
+#   python bench.py --only "terrain.*" --list
+
+BASELINE_VERSION = 1
+BENCHMARKS = []  # (name, setup); setup() returns (function, items per call)
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+def random_states(count, seed=0):
+    rng = random.Random(seed)
+    states = []
+    for _ in range(count):
+        state = {name: rng.uniform(0, 100) for name in equations.INDEPENDENT_VARIABLES}
+        state["humidity"] = state["humidity"] or 1
+        states.append(state)
+    return states
+
+
+@benchmark("equations.calculate_dependent_variables")
+def bench_dependent_variables():
+    states = random_states(1000)
+
+    def run():
+        for variables in states:
+            equations.calculate_dependent_variables(variables)
+    return run, len(states)
+
+
+@benchmark("equations.calculate_dependent_arrays")
+def bench_dependent_arrays():
+    states = random_states(100000)
+    columns = [np.array([state[name] for state in states]) for name in equations.INDEPENDENT_VARIABLES]
+    return lambda: equations.calculate_dependent_arrays(*columns), len(states)
+
+
+def _register_equation_functions():
+    # one benchmark per calculate_* function, fed positive random arguments
+    for name, function in inspect.getmembers(equations, inspect.isfunction):
+        if not name.startswith("calculate_") or name.startswith("calculate_dependent_"):
+            continue
+
+        def setup(name=name, function=function):
+            rng = random.Random(name)
+            arity = len(inspect.signature(function).parameters)
+            arguments = [tuple(rng.uniform(1, 100) for _ in range(arity)) for _ in range(1000)]
+
+            def run():
+                for values in arguments:
+                    function(*values)
+            return run, len(arguments)
+        benchmark(f"equations.{name}")(setup)
+
+
+_register_equation_functions()
+
+
+def _register_terrain():
+    simplex = OpenSimplex(seed=42)
+    for radius in (100, 200):
+        for cell in (1, 3):
+            def build(radius=radius, cell=cell):
+                # noise comes from the on-disk cache after the warm-up run
+                center = (radius + 30, radius + 30)
+                return lambda: terrain.TerrainRaster(simplex, center, radius, cell), 1
+            benchmark(f"terrain.raster r={radius} cell={cell}")(build)
+
+    @benchmark("terrain.noise_field r=50 cell=3")
+    def noise():
+        xs = list(range(0, 100, 3))
+        return lambda: terrain.noise_field(simplex, xs, xs), 1
+
+    @benchmark("terrain.draw r=200 cell=3")
+    def draw():
+        raster = terrain.TerrainRaster(simplex, (230, 230), 200, 3)
+        target = pygame.Surface((460, 460))
+        sliders = [(rainfall, plants) for rainfall in (0, 85000, 95000) for plants in (10, 60, 550)]
+        position = [0]
+
+        def run():
+            # a different palette every call
+            position[0] = (position[0] + 1) % len(sliders)
+            raster.draw(target, *sliders[position[0]])
+        return run, 1
+
+
+_register_terrain()
+
+
+@benchmark("clouds.layer r=200")
+def bench_cloud_layer():
+    # a new layer and the coverage of its first offset
+    simplex = OpenSimplex(seed=42)
+    return lambda: CloudLayer(simplex, (230, 230), 200).coverage(0), 1
+
+
+@benchmark("clouds.coverage r=200 step=2")
+def bench_cloud_coverage():
+    # Wind moving the layer 2 px a frame, without the background worker.
+    # Every offset phase has its own noise window, sampled in full on first
+    # use and topped up with a new strip once the wind has crossed its
+    # margin. The windows are filled before timing, and each call runs one
+    # whole cycle in which every phase tops up once, so all samples hold
+    # the same mix of sliding and resampling frames
+    layer = CloudLayer(OpenSimplex(seed=42), (230, 230), 200)
+    step = 2
+    margin = layer.volume.size - layer.volume.cells
+    frames = margin * CLOUD_STEP // step
+    offset = [0]
+
+    def run():
+        for _ in range(frames):
+            offset[0] += step
+            layer.coverage(offset[0])
+    run()
+    return run, frames
+
+
+@benchmark("clouds.draw r=200")
+def bench_cloud_draw():
+    layer = CloudLayer(OpenSimplex(seed=42), (230, 230), 200)
+    layer.close()  # no background worker
+    target = pygame.Surface((460, 460))
+    layer.ready[0] = layer.coverage(0)
+    opacity = [cloud_opacity(100), cloud_opacity(5000)]
+
+    def run():
+        # alternate the opacity so every call rewrites the alpha channel
+        opacity.reverse()
+        layer.shown = None
+        layer.draw(target, 0, 0, opacity[0])
+    return run, 1
+
+
+_save_dir = None
+
+
+def _main_module():
+    # main.py opens its save files and starts an autosaver on import, so it
+    # gets a scratch directory instead of the user's files in cwd
+    global _save_dir
+    if _save_dir is None:
+        _save_dir = tempfile.TemporaryDirectory(prefix="bench-")
+        os.environ["PLANET_SAVE_DIR"] = _save_dir.name
+    random.seed(0)
+    import main
+    main.screen = pygame.Surface((main.SCREEN_WIDTH, main.screenheight))
+    return main
+
+
+@benchmark("frame.draw_frame")
+def bench_full_frame():
+    main = _main_module()
+    states = random_states(30, seed=2)
+    position = [0]
+
+    def run():
+        position[0] = (position[0] + 1) % len(states)
+        main.variables.update(states[position[0]])
+        main.draw_frame((-1, -1))
+    return run, 1
+
+
+@benchmark("frame.redraw idle")
+def bench_idle_frame():
+    # the interactive path with nothing changing but the stars and clouds
+    main = _main_module()
+    main.variables.update(random_states(1, seed=3)[0])
+    main.scheduler.invalidate()
+    return lambda: main.redraw((-1, -1)), 1
+
+
+def measure(function, rounds=5, min_time=0.05):
+    function()  # warm-up: caches, lazy imports, noise on disk
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    timings = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return timings
+
+
+def run_benchmarks(pattern="*", rounds=5, min_time=0.05, out=sys.stdout):
+    results = {}
+    for name, setup in BENCHMARKS:
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        function, items = setup()
+        timings = measure(function, rounds, min_time)
+        best = min(timings) / items
+        results[name] = {
+            "seconds": best,
+            "median_seconds": statistics.median(timings) / items,
+            "rounds": rounds,
+        }
+        print(f"{name:<48}{best * 1e6:12.3f} us{items / min(timings):16,.0f} /s", file=out)
+    return results
+
+
+def machine():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_baseline(path, results):
+    with open(path, "w") as file:
+        json.dump({"version": BASELINE_VERSION, "machine": machine(), "results": results}, file, indent=2)
+
+
+def load_baseline(path):
+    with open(path) as file:
+        baseline = json.load(file)
+    if baseline.get("version") != BASELINE_VERSION:
+        raise ValueError(f"{path}: unsupported baseline version {baseline.get('version')!r}")
+    return baseline
+
+
+def compare(results, baseline, tolerance, out=sys.stdout):
+    # A benchmark regresses when its best time exceeds the baseline by more
+    # than the tolerance; a baseline entry may carry its own "tolerance".
+    # Returns the names that regressed.
+    regressions = []
+    for name, result in results.items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            print(f"{name:<48}{'new':>12}", file=out)
+            continue
+        allowed = reference.get("tolerance", tolerance)
+        ratio = result["seconds"] / reference["seconds"]
+        status = "ok"
+        if ratio > 1 + allowed:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / (1 + allowed):
+            status = "faster"
+        print(f"{name:<48}{ratio:11.2f}x  {status} (tolerance {allowed:.0%})", file=out)
+    if baseline.get("machine") != machine():
+        print("note: the baseline was recorded on a different machine or Python", file=out)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmarks with stored baselines.")
+    parser.add_argument("--only", default="*", help="run benchmarks matching this glob")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--rounds", type=int, default=5, help="timed rounds per benchmark (best is kept)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per round")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed slowdown as a fraction of the baseline (default 0.15)")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, _ in BENCHMARKS:
+            if fnmatch.fnmatch(name, args.only):
+                print(name)
+        return 0
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    results = run_benchmarks(args.only, args.rounds, args.min_time)
+    if args.save:
+        save_baseline(args.save, results)
+        print(f"baseline written to {args.save}")
+    if baseline is not None:
+        print()
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+from layers import surface_pool
+
+# Cloud layer for the planet disk. draw_clouds used to sample simplex noise
+# for every 5 px cell and draw a circle per cloudy cell each frame. Here a
+# background worker prepares the cloud coverage for the offsets the wind is
+# about to reach and keeps them in a small ring buffer; a frame only picks the
+# ready coverage and applies the opacity tier.
+
+CLOUD_SCALE = 80  # noise coordinates are (x + offset) / CLOUD_SCALE
+CLOUD_STEP = 5  # one puff per CLOUD_STEP px cell
+CLOUD_THRESHOLD = 0.2
+PUFF_RADIUS = 5
+
+
+def cloud_opacity(cloud_density):
+    if cloud_density < 100:
+        return 5
+    elif cloud_density < 150:
+        return 50
+    elif cloud_density < 200:
+        return 60
+    elif cloud_density < 400:
+        return 70
+    elif cloud_density < 1000:
+        return 90
+    elif cloud_density < 2000:
+        return 120
+    elif cloud_density < 3000:
+        return 140
+    elif cloud_density < 6000:
+        return 160
+    else:
+        return 170 # Best whiteness at 600+
+
+
+def puff_pixels():
+    # pixel offsets covered by pygame.draw.circle(..., PUFF_RADIUS)
+    size = 4 * PUFF_RADIUS + 1
+    stamp = pygame.Surface((size, size))
+    pygame.draw.circle(stamp, (255, 255, 255), (size // 2, size // 2), PUFF_RADIUS)
+    xs, ys = np.nonzero(pygame.surfarray.array2d(stamp))
+    return list(zip(xs - size // 2, ys - size // 2))
+
+
+class NoiseVolume:
+    # Cloud noise on the cell grid for whole-pixel offsets.
+    #
+    # With an offset of CLOUD_STEP * k + phase, cell (i, j) samples
+    # noise((x0 + CLOUD_STEP * (i + k) + phase) / CLOUD_SCALE, (y0 + ...)), so
+    # each phase is one 2-D grid and the wind just slides a window along its
+    # diagonal. Only the strip that enters the window is sampled.
+    def __init__(self, simplex, x0, y0, cells, margin=16):
+        self.simplex = simplex
+        self.x0, self.y0 = x0, y0
+        self.cells = cells
+        self.size = cells + margin
+        self.windows = {}  # phase -> (k0, values over [k0, k0 + size)^2)
+
+    def _sample(self, phase, columns, rows):
+        xs = (self.x0 + CLOUD_STEP * np.arange(*columns) + phase) / CLOUD_SCALE
+        ys = (self.y0 + CLOUD_STEP * np.arange(*rows) + phase) / CLOUD_SCALE
+        return self.simplex.noise2array(xs, ys)
+
+    def window(self, offset):
+        # noise for every cell at this whole-pixel offset, shape (cells, cells) as (row, column)
+        k, phase = divmod(int(offset), CLOUD_STEP)
+        k0, values = self.windows.get(phase, (None, None))
+        if k0 is None or not k0 <= k <= k0 + self.size - self.cells:
+            k0, values = self._slide(phase, k, k0, values)
+        start = k - k0
+        return values[start:start + self.cells, start:start + self.cells]
+
+    def _slide(self, phase, k, old_k0, old_values):
+        size = self.size
+        values = np.empty((size, size))
+        low = high = k
+        if old_k0 is not None:
+            low, high = max(k, old_k0), min(k + size, old_k0 + size)
+        if high <= low:
+            values[:] = self._sample(phase, (k, k + size), (k, k + size))
+        else:
+            # keep the overlapping square, sample the rest
+            values[low - k:high - k, low - k:high - k] = old_values[low - old_k0:high - old_k0,
+                                                                     low - old_k0:high - old_k0]
+            for rows in ((k, low), (high, k + size)):
+                if rows[1] > rows[0]:
+                    values[rows[0] - k:rows[1] - k, :] = self._sample(phase, (k, k + size), rows)
+            for columns in ((k, low), (high, k + size)):
+                if columns[1] > columns[0]:
+                    values[low - k:high - k, columns[0] - k:columns[1] - k] = self._sample(
+                        phase, columns, (low, high))
+        self.windows[phase] = (k, values)
+        return k, values
+
+
+class CloudLayer:
+    def __init__(self, simplex, center, radius, depth=12):
+        center_x, center_y = center
+        x0, y0 = int(center_x - radius), int(center_y - radius)
+        xs = np.arange(x0, int(center_x + radius), CLOUD_STEP)
+        ys = np.arange(y0, int(center_y + radius), CLOUD_STEP)
+        cells = max(len(xs), len(ys))
+        self.inside = np.sqrt((xs[None, :] - center_x) ** 2 + (ys[:, None] - center_y) ** 2) <= radius
+        self.volume = NoiseVolume(simplex, x0, y0, cells)
+
+        pad = 2 * PUFF_RADIUS
+        self.origin = (x0 - pad, y0 - pad)
+        self.shape = (len(xs) * CLOUD_STEP + 2 * pad, len(ys) * CLOUD_STEP + 2 * pad)  # (width, height)
+        self.puffs = [(dx + pad, dy + pad) for dx, dy in puff_pixels()]
+        self.surface = surface_pool.acquire(self.shape, pygame.SRCALPHA, fill=(255, 255, 255, 0))
+        self.shown = None
+
+        self.depth = depth
+        self.ready = OrderedDict()  # whole-pixel offset -> coverage, oldest first
+        self.hits = 0
+        self.misses = 0
+        self._compute_lock = threading.Lock()
+        self._wanted = threading.Condition()
+        self._position = None  # (offset, step) last seen by draw()
+        self._worker = None
+        self._closed = False
+
+    def coverage(self, offset):
+        # 0/1 per pixel of the layer surface, indexed (x, y) like surfarray
+        with self._compute_lock:
+            cloudy = (self.volume.window(offset) > CLOUD_THRESHOLD)[:len(self.inside), :self.inside.shape[1]]
+            cloudy &= self.inside
+        rows, columns = np.nonzero(cloudy)
+        centers_x = columns * CLOUD_STEP
+        centers_y = rows * CLOUD_STEP
+        covered = np.zeros(self.shape, dtype=np.uint8)
+        for dx, dy in self.puffs:
+            covered[centers_x + dx, centers_y + dy] = 1
+        return covered
+
+    def _run(self):
+        while True:
+            with self._wanted:
+                while not self._closed and self._next_missing() is None:
+                    self._wanted.wait()
+                if self._closed:
+                    return
+                key = self._next_missing()
+            covered = self.coverage(key)
+            with self._wanted:
+                self.ready[key] = covered
+                while len(self.ready) > self.depth:
+                    self.ready.popitem(last=False)
+
+    def _next_missing(self):
+        # the first offset the wind will reach that has no coverage yet
+        offset, step = self._position
+        for ahead in range(self.depth):
+            key = round(offset + ahead * step)
+            if key not in self.ready:
+                return key
+            if step == 0:
+                return None
+        return None
+
+    def _start_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="cloud-layer", daemon=True)
+            self._worker.start()
+
+    def prefetch(self, offset, step):
+        # starts preparing the coverage from `offset` on without drawing
+        with self._wanted:
+            self._position = (offset, step)
+            self._wanted.notify()
+        self._start_worker()
+
+    def take(self, offset, step, wait=True):
+        # without `wait` a miss returns None instead of computing the coverage here
+        key = round(offset)
+        with self._wanted:
+            self._position = (offset, step)
+            covered = self.ready.get(key)
+            # everything behind the current offset is no longer needed
+            for old in [old for old in self.ready if (old - key) * step < 0]:
+                del self.ready[old]
+            self._wanted.notify()
+        self._start_worker()
+        if covered is None:
+            self.misses += 1
+            if wait:
+                covered = self.coverage(key)
+        else:
+            self.hits += 1
+        return key, covered
+
+    def draw(self, target, offset, step, opacity, wait=True):
+        # the surface is only rewritten when the offset reaches another whole
+        # pixel; without `wait` a miss keeps showing the previous coverage
+        if self.shown != (round(offset), opacity):
+            key, covered = self.take(offset, step, wait)
+            if covered is not None:
+                self.shown = (key, opacity)
+                alpha = pygame.surfarray.pixels_alpha(self.surface)
+                np.multiply(covered, opacity, out=alpha)
+                del alpha
+        target.blit(self.surface, self.origin)
+
+    def close(self):
+        with self._wanted:
+            self._closed = True
+            self._wanted.notify()
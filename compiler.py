@@ -0,0 +1,284 @@
+import argparse
+import ast
+import math
+import random
+import time
+
+import numpy as np
+
+import equations
+from graph import NODES
+
+# The equation model written down declaratively: output name, display label,
+# expression over the sliders and earlier outputs, and clamp bounds (None for
+# no clamp). compile_scalar and compile_numpy turn it into one fused function
+# with no calls between the stages.
+#
+#   python compiler.py --show        print the generated code
+#   python compiler.py               verify and benchmark
+
+MODEL = [
+    ("temperature", "Temperature (C)", "0.02 * humidity + solar_intensity", 0.0, 102.0),
+    ("cloud_density", "Cloud Density", "(humidity**2) / max(solar_intensity, 1)", 0.0, 10000.0),
+    ("photosynthesis", "Photosynthesis", "temperature * (0.5 + 0.5 * cos(cloud_density))", 0, 101),
+    ("plants_density", "Plants Density", "solar_intensity**2 / 10 + photosynthesis", 0.0, 1101.31),
+    ("oxygen", "Oxygen", "5 + 1.5 * photosynthesis + plants_density**2 - 0.05 * population", 0.0, 1213028.81),
+    ("carbon_dioxide", "Carbon Dioxide", "40 + 10 * population - 0.005 * photosynthesis", 39.49, 1040.0),
+    ("asi", "ASI", "sqrt(oxygen**2 + carbon_dioxide**2)", 39.99, 1213028.81),
+    ("rainfall_intensity", "Rainfall Intensity",
+     "0.1 * humidity * solar_intensity * (1 + wind_speed / 100)", 0.0, 2000.0),
+    ("radius_of_wet_ground", "Radius of wet ground", "rainfall_intensity * wind_speed", 0.0, 200000.0),
+    ("rainfall_area", "Rainfall Area", "pi * radius_of_wet_ground * 2", 0.0, 1256637.06),
+    ("power", "Power", "temperature**2 + wind_speed", 0.0, 10504.0),
+    ("uv_index", "UV index", "0.01 * temperature * solar_intensity", 0.0, 102.0),
+    ("pollution", "Pollution", "10 * population + 0.005 * wind_speed", 0.0, 1000.5),
+    ("health_risk", "Health Risk", "log(1 + uv_index + pollution)", 0.0, 11.53),
+    ("crop_yield", "Crop Yield",
+     "0.05 * (solar_intensity - 20) * humidity * plants_density if solar_intensity > 20 else 0", 0, 437991.30),
+    ("hunger", "Hunger", "population / max(crop_yield, 1)", 0.0, 100.0),
+    ("water_resources", "Water Resources",
+     "10 + rainfall_intensity + 0.2 * wind_speed - 0.05 * population", 5.0, 2030.0),
+    ("thirst", "Thirst", "population / max(rainfall_area, 1)", 0.0, 100.0),
+    # calculate_dependent_variables reports cloud density under "Albedo"
+    ("albedo", "Albedo", "cloud_density", None, None),
+]
+
+SCALAR_NAMESPACE = {"cos": math.cos, "sqrt": math.sqrt, "log": math.log, "pi": math.pi}
+NUMPY_NAMESPACE = {"np": np, "pi": math.pi, "_log": equations._log_like_math}
+
+
+class _ToNumpy(ast.NodeTransformer):
+    # rewrites a scalar expression into its elementwise NumPy form
+    functions = {"cos": "np.cos", "sqrt": "np.sqrt", "log": "_log", "max": "np.maximum"}
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in self.functions:
+            node.func = ast.parse(self.functions[node.func.id], mode="eval").body
+        return node
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        return ast.Call(func=ast.parse("np.where", mode="eval").body,
+                        args=[node.test, node.body, node.orelse], keywords=[])
+
+
+class _InlineMax(ast.NodeTransformer):
+    # max(a, b) over plain names and numbers becomes (a if a >= b else b),
+    # which returns the same object as max() but skips the builtin call
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if (isinstance(node.func, ast.Name) and node.func.id == "max" and len(node.args) == 2
+                and not node.keywords and all(isinstance(arg, (ast.Name, ast.Constant)) for arg in node.args)):
+            first, second = node.args
+            return ast.IfExp(test=ast.Compare(left=first, ops=[ast.GtE()], comparators=[second]),
+                             body=first, orelse=second)
+        return node
+
+
+def _reported(model):
+    # outputs in the order calculate_dependent_variables reports them
+    position = {name: i for i, (name, _) in enumerate(equations.DEPENDENT_VARIABLES)}
+    return sorted(model, key=lambda entry: position.get(entry[0], len(position)))
+
+
+def _scalar_lines(output, expression, low, high):
+    expression = ast.unparse(_InlineMax().visit(ast.parse(expression, mode="eval")))
+    lines = [f"    {output} = {expression}"]
+    if low is not None:
+        lines.append(f"    if {output} < {low!r}:")
+        lines.append(f"        {output} = {low!r}")
+    if high is not None:
+        lines.append(f"    {'elif' if low is not None else 'if'} {output} > {high!r}:")
+        lines.append(f"        {output} = {high!r}")
+    return lines
+
+
+def _scalar_source(model, name, positional=False, truncate=True):
+    inputs = equations.INDEPENDENT_VARIABLES
+    if positional:
+        lines = [f"def {name}({', '.join(inputs)}):"]
+    else:
+        lines = [f"def {name}(variables):"]
+        lines += [f"    {variable} = variables[{variable!r}]" for variable in inputs]
+    for output, _, expression, low, high in model:
+        lines += _scalar_lines(output, expression, low, high)
+    if positional:
+        outputs = [f"int({output})" if truncate else output for output, _, _, _, _ in _reported(model)]
+        lines.append(f"    return ({', '.join(outputs)})")
+    else:
+        lines.append("    return {")
+        lines += [f"        {label!r}: int({output})," for output, label, _, _, _ in _reported(model)]
+        lines.append("    }")
+    return "\n".join(lines) + "\n"
+
+
+def _into_source(model, name, offset, truncate=True):
+    inputs = equations.INDEPENDENT_VARIABLES
+    lines = [f"def {name}(values):"]
+    lines += [f"    {variable} = values[{index}]" for index, variable in enumerate(inputs)]
+    for output, _, expression, low, high in model:
+        lines += _scalar_lines(output, expression, low, high)
+    for index, (output, _, _, _, _) in enumerate(_reported(model)):
+        lines.append(f"    values[{offset + index}] = {f'int({output})' if truncate else output}")
+    return "\n".join(lines) + "\n"
+
+
+def _numpy_source(model, name):
+    inputs = equations.INDEPENDENT_VARIABLES
+    lines = [f"def {name}({', '.join(inputs)}):"]
+    lines.append(f"    {', '.join(inputs)} = np.broadcast_arrays("
+                 + ", ".join(f"np.asarray({variable}, dtype=np.float64)" for variable in inputs) + ")")
+    for output, _, expression, low, high in model:
+        expression = ast.unparse(_ToNumpy().visit(ast.parse(expression, mode="eval")))
+        if low is None and high is None:
+            lines.append(f"    {output} = {expression}")
+        else:
+            lines.append(f"    {output} = np.clip({expression}, {low!r}, {high!r})")
+    lines.append("    return {")
+    lines += [f"        {output!r}: {output}," for output, _, _, _, _ in _reported(model)]
+    lines.append("    }")
+    return "\n".join(lines) + "\n"
+
+
+def _build(source, name, namespace):
+    namespace = dict(namespace)
+    exec(compile(source, f"<compiled {name}>", "exec"), namespace)
+    function = namespace[name]
+    function.source = source
+    return function
+
+
+def compile_scalar(model=MODEL, name="calculate_dependent_variables", positional=False, truncate=True):
+    # Drop-in replacement for equations.calculate_dependent_variables. With
+    # positional=True the function takes the four sliders as arguments and
+    # returns a tuple in DEPENDENT_VARIABLES order, skipping the dict lookups
+    # and build; truncate=False keeps those outputs as floats.
+    return _build(_scalar_source(model, name, positional, truncate), name, SCALAR_NAMESPACE)
+
+
+def compile_into(model=MODEL, name="evaluate_into", offset=len(equations.INDEPENDENT_VARIABLES), truncate=True):
+    # In-place variant for state.PlanetState: reads the sliders from
+    # values[0:4] and writes the outputs in DEPENDENT_VARIABLES order from
+    # values[offset] on, so an evaluation builds no dict or tuple
+    return _build(_into_source(model, name, offset, truncate), name, SCALAR_NAMESPACE)
+
+
+def compile_numpy(model=MODEL, name="calculate_dependent_arrays"):
+    # Same contract as equations.calculate_dependent_arrays
+    return _build(_numpy_source(model, name), name, NUMPY_NAMESPACE)
+
+
+def random_states(count, seed=0):
+    rng = random.Random(seed)
+    states = []
+    for _ in range(count):
+        # mix continuous values with whole numbers, which hit the clamps and branches exactly
+        values = [rng.choice((rng.uniform(0, 100), float(rng.randint(0, 100)), rng.randint(0, 100)))
+                  for _ in equations.INDEPENDENT_VARIABLES]
+        values[1] = values[1] or 1  # calculate_albedo divides by cloud density
+        states.append(dict(zip(equations.INDEPENDENT_VARIABLES, values)))
+    return states
+
+
+def check_nodes(model=MODEL, samples=2000, seed=0):
+    # every declared expression + clamp against its calculate_* function
+    rng = random.Random(seed)
+    for output, _, expression, low, high in model:
+        function, sources = NODES[output]
+        lines = [f"def node({', '.join(sources)}):"] + _scalar_lines(output, expression, low, high)
+        lines.append(f"    return {output}")
+        node = _build("\n".join(lines) + "\n", "node", SCALAR_NAMESPACE)
+        for _ in range(samples):
+            values = [rng.uniform(0, 2000) for _ in sources]
+            expected = function(*values)
+            got = node(*values)
+            if got != expected:
+                raise AssertionError(f"{output}: generated {got!r}, {function.__name__} gives {expected!r} "
+                                     f"for {dict(zip(sources, values))}")
+
+
+def check(scalar, vectorized=None, positional=None, states=None, into=None):
+    states = states or random_states(20000)
+    inputs = len(equations.INDEPENDENT_VARIABLES)
+    values = [0.0] * (inputs + len(equations.DEPENDENT_VARIABLES))
+    expected = [equations.calculate_dependent_variables(variables) for variables in states]
+    for variables, reference in zip(states, expected):
+        got = scalar(variables)
+        if got != reference:
+            raise AssertionError(f"compiled scalar model differs at {variables}: {got} != {reference}")
+        if positional is not None:
+            got = positional(*(variables[name] for name in equations.INDEPENDENT_VARIABLES))
+            if got != tuple(reference.values()):
+                raise AssertionError(f"compiled positional model differs at {variables}: {got}")
+        if into is not None:
+            values[:inputs] = [variables[name] for name in equations.INDEPENDENT_VARIABLES]
+            into(values)
+            if values[inputs:] != list(reference.values()):
+                raise AssertionError(f"compiled in-place model differs at {variables}: {values[inputs:]}")
+    if vectorized is not None:
+        columns = [np.array([state[name] for state in states], dtype=np.float64)
+                   for name in equations.INDEPENDENT_VARIABLES]
+        values = vectorized(*columns)
+        for output, label in equations.DEPENDENT_VARIABLES:
+            if not np.array_equal(values[output].astype(np.int64), [reference[label] for reference in expected]):
+                raise AssertionError(f"compiled numpy model differs on {label}")
+
+
+def benchmark(scalar, vectorized, positional, count=50000):
+    states = random_states(count, seed=1)
+
+    def timed(function):
+        start = time.perf_counter()
+        for variables in states:
+            function(variables)
+        return (time.perf_counter() - start) / count
+
+    reference = timed(equations.calculate_dependent_variables)
+    fused = timed(scalar)
+    print(f"scalar:  calculate_dependent_variables {reference * 1e6:.2f} us, "
+          f"fused {fused * 1e6:.2f} us, speedup {reference / fused:.2f}x")
+    arguments = [tuple(variables[name] for name in equations.INDEPENDENT_VARIABLES) for variables in states]
+    start = time.perf_counter()
+    for values in arguments:
+        positional(*values)
+    fused = (time.perf_counter() - start) / count
+    print(f"         fused positional {fused * 1e6:.2f} us, speedup {reference / fused:.2f}x")
+
+    columns = [np.array([state[name] for state in states], dtype=np.float64)
+               for name in equations.INDEPENDENT_VARIABLES]
+    start = time.perf_counter()
+    equations.calculate_dependent_arrays(*columns)
+    reference = time.perf_counter() - start
+    start = time.perf_counter()
+    vectorized(*columns)
+    fused = time.perf_counter() - start
+    print(f"numpy:   calculate_dependent_arrays {count / reference:,.0f} points/s, "
+          f"compiled {count / fused:,.0f} points/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the declarative equation model into fused functions.")
+    parser.add_argument("--show", action="store_true", help="print the generated source and exit")
+    parser.add_argument("--samples", type=int, default=50000, help="states used for the benchmark")
+    args = parser.parse_args(argv)
+
+    scalar = compile_scalar()
+    positional = compile_scalar(name="evaluate", positional=True)
+    vectorized = compile_numpy()
+    into = compile_into()
+    if args.show:
+        print(scalar.source)
+        print(positional.source)
+        print(into.source)
+        print(vectorized.source)
+        return
+
+    check_nodes()
+    check(scalar, vectorized, positional, into=into)
+    print("generated code matches the calculate_* functions")
+    benchmark(scalar, vectorized, positional, args.samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 def calculate_temperature(humidity, solar_intensity):
     temp = 0.02 * humidity + solar_intensity
@@ -199,3 +200,98 @@ def calculate_dependent_variables(variables):
     }
 
 
+INDEPENDENT_VARIABLES = ["solar_intensity", "humidity", "wind_speed", "population"]
+
+# where the sliders start, and what saved states fall back to
+DEFAULT_VARIABLES = {"solar_intensity": 0, "humidity": 50, "wind_speed": 10, "population": 1000}
+
+# (machine name, display label) in the order calculate_dependent_variables reports them
+DEPENDENT_VARIABLES = [
+    ("temperature", "Temperature (C)"),
+    ("cloud_density", "Cloud Density"),
+    ("photosynthesis", "Photosynthesis"),
+    ("oxygen", "Oxygen"),
+    ("carbon_dioxide", "Carbon Dioxide"),
+    ("asi", "ASI"),
+    ("rainfall_intensity", "Rainfall Intensity"),
+    ("radius_of_wet_ground", "Radius of wet ground"),
+    ("rainfall_area", "Rainfall Area"),
+    ("power", "Power"),
+    ("uv_index", "UV index"),
+    ("pollution", "Pollution"),
+    ("health_risk", "Health Risk"),
+    ("plants_density", "Plants Density"),
+    ("crop_yield", "Crop Yield"),
+    ("hunger", "Hunger"),
+    ("water_resources", "Water Resources"),
+    ("thirst", "Thirst"),
+    ("albedo", "Albedo"),
+]
+
+def _log_like_math(x):
+    # np.log can be 1 ulp away from math.log; redo the values that sit close
+    # enough to an integer for int() to notice
+    result = np.array(np.log(x))
+    fragile = np.abs(result - np.round(result)) < 1e-9
+    if fragile.any():
+        result[fragile] = [math.log(v) for v in x[fragile]]
+    return result
+
+def calculate_dependent_arrays(solar_intensity, humidity, wind_speed, population):
+    # Batch version of calculate_dependent_variables: same equations and clamps,
+    # evaluated over whole arrays of slider states. Values are left as floats.
+    solar_intensity = np.asarray(solar_intensity, dtype=np.float64)
+    humidity = np.asarray(humidity, dtype=np.float64)
+    wind_speed = np.asarray(wind_speed, dtype=np.float64)
+    population = np.asarray(population, dtype=np.float64)
+    solar_intensity, humidity, wind_speed, population = np.broadcast_arrays(
+        solar_intensity, humidity, wind_speed, population)
+
+    temperature = np.clip(0.02 * humidity + solar_intensity, 0.0, 102.0)
+    cloud_density = np.clip((humidity**2) / np.maximum(solar_intensity, 1), 0.0, 10000.0)
+    photosynthesis = np.clip(temperature * (0.5 + 0.5 * np.cos(cloud_density)), 0, 101)
+    plants_density = np.clip(solar_intensity**2 / 10 + photosynthesis, 0.0, 1101.31)
+    oxygen = np.clip(5 + 1.5 * photosynthesis + plants_density**2 - 0.05 * population, 0.0, 1213028.81)
+    carbon_dioxide = np.clip(40 + 10 * population - 0.005 * photosynthesis, 39.49, 1040.0)
+    asi = np.clip(np.sqrt(oxygen**2 + carbon_dioxide**2), 39.99, 1213028.81)
+    rainfall_intensity = np.clip(0.1 * humidity * solar_intensity * (1 + wind_speed / 100), 0.0, 2000.0)
+    radius_of_wet_ground = np.clip(rainfall_intensity * wind_speed, 0.0, 200000.0)
+    rainfall_area = np.clip(math.pi * radius_of_wet_ground * 2, 0.0, 1256637.06)
+    power = np.clip(temperature**2 + wind_speed, 0.0, 10504.0)
+    uv_index = np.clip(0.01 * temperature * solar_intensity, 0.0, 102.0)
+    pollution = np.clip(10 * population + 0.005 * wind_speed, 0.0, 1000.5)
+    health_risk = np.clip(_log_like_math(1 + uv_index + pollution), 0.0, 11.53)
+    crop_yield = np.where(solar_intensity > 20,
+                          0.05 * (solar_intensity - 20) * humidity * plants_density, 0)
+    crop_yield = np.clip(crop_yield, 0, 437991.30)
+    hunger = np.clip(population / np.maximum(crop_yield, 1), 0.0, 100.0)
+    water_resources = np.clip(10 + rainfall_intensity + 0.2 * wind_speed - 0.05 * population, 5.0, 2030.0)
+    thirst = np.clip(population / np.maximum(rainfall_area, 1), 0.0, 100.0)
+
+    return {
+        "temperature": temperature,
+        "cloud_density": cloud_density,
+        "photosynthesis": photosynthesis,
+        "oxygen": oxygen,
+        "carbon_dioxide": carbon_dioxide,
+        "asi": asi,
+        "rainfall_intensity": rainfall_intensity,
+        "radius_of_wet_ground": radius_of_wet_ground,
+        "rainfall_area": rainfall_area,
+        "power": power,
+        "uv_index": uv_index,
+        "pollution": pollution,
+        "health_risk": health_risk,
+        "plants_density": plants_density,
+        "crop_yield": crop_yield,
+        "hunger": hunger,
+        "water_resources": water_resources,
+        "thirst": thirst,
+        # the scalar path reports cloud density under "Albedo", keep doing the same
+        "albedo": cloud_density,
+    }
+
+def calculate_dependent_variables_batch(solar_intensity, humidity, wind_speed, population):
+    # Same keys and int() truncation as calculate_dependent_variables, one int64 array per output
+    values = calculate_dependent_arrays(solar_intensity, humidity, wind_speed, population)
+    return {label: values[name].astype(np.int64) for name, label in DEPENDENT_VARIABLES}
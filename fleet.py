@@ -0,0 +1,326 @@
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+from opensimplex import OpenSimplex
+
+import compiler
+import equations
+import poster
+import terrain
+from labels import TextCache
+from optimizer import parse_constraint, save_setting, SAVE_FILE
+
+# Many planets side by side. FleetStore keeps the four sliders and 19 outputs
+# of every planet as rows of two contiguous arrays (one row per variable), so
+# the whole fleet is evaluated in one call of the compiled NumPy model and
+# sorted or filtered by any column. ThumbnailCache draws a small picture of a
+# planet with the poster renderer's colour rules, keyed by the planet's id and
+# input version, and FleetGrid lays the thumbnails out in a scrolling grid.
+#
+#   python fleet.py --count 2000 --sort asi --where "hunger<=1"
+#   python fleet.py --count 500 --screenshot fleet.png
+
+INPUTS = equations.INDEPENDENT_VARIABLES
+OUTPUTS = [name for name, _ in equations.DEPENDENT_VARIABLES]
+SLIDER_RANGE = (0.0, 100.0)
+
+
+class FleetStore:
+    def __init__(self, capacity=1024):
+        self.inputs = np.zeros((len(INPUTS), capacity))
+        self.outputs = np.zeros((len(OUTPUTS), capacity))
+        self.ids = np.zeros(capacity, dtype=np.int64)  # stable across removals
+        self.versions = np.zeros(capacity, dtype=np.int64)  # bumped on every input change
+        self.dirty = np.zeros(capacity, dtype=bool)  # outputs out of date
+        self.count = 0
+        self.next_id = 0
+        self.evaluations = 0
+        self.model = compiler.compile_numpy()
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, count):
+        capacity = self.ids.size
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        for name in ("inputs", "outputs"):
+            old = getattr(self, name)
+            grown = np.zeros((old.shape[0], capacity))
+            grown[:, :self.count] = old[:, :self.count]
+            setattr(self, name, grown)
+        for name in ("ids", "versions", "dirty"):
+            old = getattr(self, name)
+            grown = np.zeros(capacity, dtype=old.dtype)
+            grown[:self.count] = old[:self.count]
+            setattr(self, name, grown)
+
+    def add(self, **columns):
+        # one value or array per slider, broadcast together; returns the new ids
+        values = np.broadcast_arrays(*(np.atleast_1d(np.asarray(columns[name], dtype=np.float64)) for name in INPUTS))
+        added = values[0].size
+        begin, end = self.count, self.count + added
+        self._reserve(end)
+        for row, column in enumerate(values):
+            self.inputs[row, begin:end] = column.ravel()
+        self.ids[begin:end] = np.arange(self.next_id, self.next_id + added)
+        self.versions[begin:end] = 0
+        self.dirty[begin:end] = True
+        self.count = end
+        self.next_id += added
+        return self.ids[begin:end].copy()
+
+    def add_states(self, states):
+        return self.add(**{name: [state[name] for state in states] for name in INPUTS})
+
+    @classmethod
+    def random(cls, count, seed=0):
+        rng = np.random.default_rng(seed)
+        fleet = cls(max(count, 1))
+        fleet.add(**{name: rng.uniform(*SLIDER_RANGE, count) for name in INPUTS})
+        return fleet
+
+    def set_inputs(self, rows, **values):
+        # rows: index, index array or boolean mask over the fleet
+        rows = np.arange(self.count)[rows]
+        for name, value in values.items():
+            self.inputs[INPUTS.index(name), rows] = value
+        self.versions[rows] += 1
+        self.dirty[rows] = True
+
+    def remove(self, rows):
+        keep = np.ones(self.count, dtype=bool)
+        keep[rows] = False
+        kept = int(keep.sum())
+        self.inputs[:, :kept] = self.inputs[:, :self.count][:, keep]
+        self.outputs[:, :kept] = self.outputs[:, :self.count][:, keep]
+        for name in ("ids", "versions", "dirty"):
+            array = getattr(self, name)
+            array[:kept] = array[:self.count][keep]
+        self.count = kept
+
+    def evaluate(self):
+        # the outputs of every planet whose inputs changed, in one batch
+        rows = np.flatnonzero(self.dirty[:self.count])
+        if len(rows) == 0:
+            return 0
+        outputs = self.model(*self.inputs[:, rows])
+        for index, name in enumerate(OUTPUTS):
+            self.outputs[index, rows] = outputs[name]
+        self.dirty[rows] = False
+        self.evaluations += len(rows)
+        return len(rows)
+
+    def column(self, name):
+        # a view of one slider or output over the fleet
+        if name in INPUTS:
+            return self.inputs[INPUTS.index(name), :self.count]
+        self.evaluate()
+        return self.outputs[OUTPUTS.index(name), :self.count]
+
+    def sort(self, by, descending=False, rows=None):
+        # row indices ordered by a column; rows limits the result to a subset
+        values = self.column(by)
+        rows = np.arange(self.count) if rows is None else np.asarray(rows)
+        order = np.argsort(-values[rows] if descending else values[rows], kind="stable")
+        return rows[order]
+
+    def filter(self, *constraints, rows=None):
+        # rows meeting every constraint, written as in optimizer.py ("Hunger<=1")
+        mask = np.ones(self.count, dtype=bool)
+        for constraint in constraints:
+            name, sign, bound = parse_constraint(constraint) if isinstance(constraint, str) else constraint
+            mask &= sign * (self.column(name) - bound) <= 0
+        rows = np.arange(self.count) if rows is None else np.asarray(rows)
+        return rows[mask[rows]]
+
+    def state(self, row):
+        # the sliders of one planet, e.g. for main.variables
+        return {name: float(self.inputs[index, row]) for index, name in enumerate(INPUTS)}
+
+    def dependent_variables(self, row):
+        # one planet's outputs as calculate_dependent_variables reports them
+        self.evaluate()
+        return {label: int(self.outputs[index, row]) for index, (_, label) in enumerate(equations.DEPENDENT_VARIABLES)}
+
+
+class ThumbnailCache:
+    # Thumbnails of size x size px showing what poster.py draws (glow, terrain,
+    # shading and clouds at offset 0). The terrain bands and cloud mask are the
+    # same for every planet, so they are sampled once; a planet is only
+    # repainted when its inputs change.
+    def __init__(self, size=96, max_entries=4096, seed=42):
+        self.size = size
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # planet id -> (version, surface)
+        self.hits = 0
+        self.misses = 0
+        simplex = OpenSimplex(seed=seed)
+        scale = size / (2 * (poster.RADIUS + poster.MARGIN))
+        xs = poster.CENTER[0] - poster.RADIUS - poster.MARGIN + (np.arange(size) + 0.5) / scale
+        ys = poster.CENTER[1] - poster.RADIUS - poster.MARGIN + (np.arange(size) + 0.5) / scale
+        self.distance = (xs[None, :] - poster.CENTER[0]) ** 2 + (ys[:, None] - poster.CENTER[1]) ** 2
+        self.bands = terrain.terrain_bands(terrain.cached_noise_field(simplex, xs, ys))
+        self.covered = poster.cloud_coverage(simplex, xs, ys, 0.0)
+
+    def render(self, fleet, row):
+        scene = poster.planet_scene(fleet.dependent_variables(row), fleet.inputs[INPUTS.index("solar_intensity"), row])
+        pixels = poster.paint(scene, self.distance, self.bands, self.covered)
+        return pygame.surfarray.make_surface(pixels.swapaxes(0, 1))
+
+    def get(self, fleet, row):
+        key = int(fleet.ids[row])
+        version = int(fleet.versions[row])
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        surface = self.render(fleet, row)
+        self.entries[key] = (version, surface)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surface
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class FleetGrid:
+    # rows of thumbnails inside `rect`, each with the value of one column under it
+    def __init__(self, thumbnails, rect, font, text_cache=None, padding=6):
+        self.thumbnails = thumbnails
+        self.rect = pygame.Rect(rect)
+        self.font = font
+        self.text_cache = text_cache or TextCache()
+        self.cell = (thumbnails.size + padding, thumbnails.size + font.get_linesize() + padding)
+        self.columns = max(1, self.rect.width // self.cell[0])
+
+    def max_scroll(self, count):
+        rows = -(-count // self.columns)
+        return max(0, rows * self.cell[1] - self.rect.height)
+
+    def visible(self, count, scroll):
+        # (position in the ordering, top-left corner) of every cell on screen
+        first = scroll // self.cell[1] * self.columns
+        last = min(count, (scroll + self.rect.height) // self.cell[1] * self.columns + self.columns)
+        for position in range(first, last):
+            row, column = divmod(position, self.columns)
+            yield position, (self.rect.x + column * self.cell[0], self.rect.y + row * self.cell[1] - scroll)
+
+    def draw(self, target, fleet, rows, scroll=0, label=None, selected=None, color=(255, 255, 255)):
+        previous_clip = target.get_clip()
+        target.set_clip(self.rect)
+        values = fleet.column(label) if label else None
+        for position, (x, y) in self.visible(len(rows), scroll):
+            row = rows[position]
+            target.blit(self.thumbnails.get(fleet, row), (x, y))
+            if row == selected:
+                pygame.draw.rect(target, (224, 180, 74), (x - 2, y - 2, self.thumbnails.size + 4,
+                                                          self.thumbnails.size + 4), 2)
+            if values is not None:
+                text = self.text_cache.render(self.font, f"{values[row]:.4g}", color)
+                target.blit(text, (x, y + self.thumbnails.size + 1))
+        target.set_clip(previous_clip)
+
+    def row_at(self, position, rows, scroll=0):
+        x, y = position
+        if not self.rect.collidepoint(x, y):
+            return None
+        column = (x - self.rect.x) // self.cell[0]
+        index = (y - self.rect.y + scroll) // self.cell[1] * self.columns + column
+        if column >= self.columns or index >= len(rows):
+            return None
+        return rows[index]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Browse a fleet of planets as a grid of thumbnails.")
+    parser.add_argument("--count", type=int, default=1000, help="random planets in the fleet")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random fleet")
+    parser.add_argument("--sort", default="asi", help="slider or output to sort by (S cycles)")
+    parser.add_argument("--ascending", action="store_true", help="smallest first (R flips)")
+    parser.add_argument("--where", action="append", default=[], metavar="OUTPUT<=VALUE",
+                        help="only show planets meeting this bound")
+    parser.add_argument("--size", type=int, default=96, help="thumbnail size in pixels")
+    parser.add_argument("--screenshot", metavar="PATH", help="render one frame to PATH and exit")
+    args = parser.parse_args(argv)
+    if args.screenshot:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+    pygame.init()
+    screen = pygame.display.set_mode((1200, 700))
+    pygame.display.set_caption("Planet fleet")
+    font = pygame.font.Font(None, 20)
+    text_cache = TextCache()
+
+    start = time.perf_counter()
+    fleet = FleetStore.random(args.count, args.seed)
+    fleet.evaluate()
+    print(f"{len(fleet)} planets evaluated in {(time.perf_counter() - start) * 1e3:.1f} ms", file=sys.stderr)
+    grid = FleetGrid(ThumbnailCache(args.size), (10, 40, 1180, 650), font, text_cache)
+    columns = INPUTS + OUTPUTS
+    sort_by = args.sort if args.sort in columns else parse_constraint(f"{args.sort}<=0")[0]
+    descending = not args.ascending
+    scroll = 0
+    selected = None
+    clock = pygame.time.Clock()
+    running = True
+    while running:
+        rows = fleet.sort(sort_by, descending, fleet.filter(*args.where))
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.MOUSEWHEEL:
+                scroll = max(0, min(grid.max_scroll(len(rows)), scroll - event.y * grid.cell[1] // 2))
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                selected = grid.row_at(event.pos, rows, scroll)
+                if selected is not None:
+                    print(fleet.state(selected), fleet.dependent_variables(selected))
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_s:
+                    sort_by = columns[(columns.index(sort_by) + 1) % len(columns)]
+                elif event.key == pygame.K_r:
+                    descending = not descending
+                elif event.key == pygame.K_m:
+                    # nudge a tenth of the fleet; only those thumbnails are repainted
+                    changed = np.flatnonzero(np.random.random(len(fleet)) < 0.1)
+                    solar = fleet.column("solar_intensity")[changed]
+                    fleet.set_inputs(changed, solar_intensity=np.clip(solar + np.random.normal(0, 5, len(changed)),
+                                                                      *SLIDER_RANGE))
+                elif event.key == pygame.K_RETURN and selected is not None:
+                    save_setting(fleet.state(selected))
+                    print(f"planet {int(fleet.ids[selected])} written to {SAVE_FILE}")
+
+        screen.fill((0, 0, 0))
+        order = "descending" if descending else "ascending"
+        header = (f"{len(rows)}/{len(fleet)} planets by {sort_by} ({order})   "
+                  "S: sort column  R: reverse  M: mutate  click: select  Enter: save for main.py")
+        screen.blit(text_cache.render(font, header, (255, 255, 255)), (10, 12))
+        grid.draw(screen, fleet, rows, scroll, sort_by, selected)
+        if args.screenshot:
+            pygame.image.save(screen, args.screenshot)
+            print(f"{args.screenshot}: {grid.thumbnails.stats()}", file=sys.stderr)
+            break
+        pygame.display.flip()
+        clock.tick(30)
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import equations
+
+# The equations as a fixed DAG: every node names the calculate_* function that
+# produces it and the nodes (or slider inputs) it reads. DependencyGraph only
+# recomputes nodes downstream of a changed input, and only the ones a caller
+# asks for, and counts what it evaluated and skipped. main.py evaluates the
+# whole fused model in place instead (state.StateModel); the graph is for
+# callers that want a few outputs, and compiler.check_nodes tests the fused
+# expressions against NODES.
+
+
+def reported_albedo(cloud_density):
+    # calculate_dependent_variables reports cloud density under "Albedo"
+    return cloud_density
+
+
+NODES = {
+    "temperature": (equations.calculate_temperature, ("humidity", "solar_intensity")),
+    "cloud_density": (equations.calculate_cloud_density, ("humidity", "solar_intensity")),
+    "photosynthesis": (equations.calculate_photosynthesis, ("temperature", "cloud_density")),
+    "plants_density": (equations.calculate_plants_density, ("solar_intensity", "photosynthesis")),
+    "oxygen": (equations.calculate_oxygen, ("photosynthesis", "plants_density", "population")),
+    "carbon_dioxide": (equations.calculate_carbon_dioxide, ("photosynthesis", "population")),
+    "asi": (equations.calculate_asi, ("oxygen", "carbon_dioxide")),
+    "rainfall_intensity": (equations.calculate_rainfall_intensity, ("humidity", "solar_intensity", "wind_speed")),
+    "radius_of_wet_ground": (equations.calculate_radius_of_wet_ground, ("rainfall_intensity", "wind_speed")),
+    "rainfall_area": (equations.calculate_rainfall_area, ("radius_of_wet_ground",)),
+    "power": (equations.calculate_power, ("temperature", "wind_speed")),
+    "uv_index": (equations.calculate_uv_index, ("temperature", "solar_intensity")),
+    "pollution": (equations.calculate_pollution, ("population", "wind_speed")),
+    "health_risk": (equations.calculate_health_risk, ("uv_index", "pollution")),
+    "crop_yield": (equations.calculate_crop_yield, ("solar_intensity", "humidity", "plants_density")),
+    "hunger": (equations.calculate_hunger, ("population", "crop_yield")),
+    "water_resources": (equations.calculate_water_resources, ("rainfall_intensity", "wind_speed", "population")),
+    "thirst": (equations.calculate_thirst, ("population", "rainfall_area")),
+    "albedo": (reported_albedo, ("cloud_density",)),
+}
+
+LABELS = dict(equations.DEPENDENT_VARIABLES)
+NAMES = {label: name for name, label in equations.DEPENDENT_VARIABLES}
+
+
+class DependencyGraph:
+    def __init__(self, nodes=NODES, inputs=equations.INDEPENDENT_VARIABLES):
+        self.nodes = nodes
+        self.inputs = list(inputs)
+        self.order = self._topological_order()
+
+        # transitive closures, computed once
+        self.upstream = {}
+        for name in self.order:
+            needed = set()
+            for source in nodes[name][1]:
+                if source in nodes:
+                    needed |= self.upstream[source]
+            needed.add(name)
+            self.upstream[name] = needed
+        self.downstream = {source: {name for name in self.order if source in self._reads(name)}
+                           for source in self.inputs}
+
+        self.values = {}
+        self.dirty = set(self.order)
+
+        # counters for the last evaluate() call and running totals
+        self.evaluated = 0
+        self.skipped = 0
+        self.total_evaluated = 0
+        self.total_skipped = 0
+
+    def _reads(self, name):
+        # every input and node that name depends on, directly or not
+        reads = set()
+        for node in self.upstream[name]:
+            reads.update(self.nodes[node][1])
+        return reads
+
+    def _topological_order(self):
+        order, seen = [], set(self.inputs)
+
+        def visit(name, path):
+            if name in seen:
+                return
+            if name in path:
+                raise ValueError(f"cycle in equation graph at {name!r}")
+            if name not in self.nodes:
+                raise KeyError(f"equation graph has no node or input {name!r}")
+            for source in self.nodes[name][1]:
+                visit(source, path | {name})
+            seen.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name, frozenset())
+        return order
+
+    def set_inputs(self, variables):
+        for name in self.inputs:
+            value = variables[name]
+            if name not in self.values or self.values[name] != value:
+                self.values[name] = value
+                self.dirty |= self.downstream[name]
+
+    def evaluate(self, outputs=None):
+        # Bring the requested nodes (all of them by default) up to date and
+        # return their values
+        outputs = self.order if outputs is None else outputs
+        needed = set()
+        for name in outputs:
+            needed |= self.upstream[name]
+        stale = needed & self.dirty
+
+        for name in self.order:
+            if name in stale:
+                function, sources = self.nodes[name]
+                self.values[name] = function(*(self.values[source] for source in sources))
+        self.dirty -= stale
+
+        self.evaluated = len(stale)
+        self.skipped = len(self.order) - len(stale)
+        self.total_evaluated += self.evaluated
+        self.total_skipped += self.skipped
+        return {name: self.values[name] for name in outputs}
+
+    def calculate_dependent_variables(self, variables, labels=None):
+        # Same result as equations.calculate_dependent_variables, restricted to
+        # the given display labels when asked
+        self.set_inputs(variables)
+        if labels is None:
+            labels = list(LABELS.values())
+        values = self.evaluate([NAMES[label] for label in labels])
+        return {label: int(values[NAMES[label]]) for label in labels}
+
+    def stats(self):
+        return {
+            "evaluated": self.evaluated,
+            "skipped": self.skipped,
+            "total_evaluated": self.total_evaluated,
+            "total_skipped": self.total_skipped,
+        }
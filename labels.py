@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+# Rendered text for the sliders, bars and buttons. font.render rasterizes the
+# glyphs every call; TextCache keeps the surfaces by (text, font, colour) and
+# drops the least recently used ones past max_entries. Labels are drawn as a
+# static prefix plus the number, so a changed value only renders the number.
+
+
+class TextCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (text, font, color, antialias)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.entries[key] = surface
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surface
+
+    def label(self, font, prefix, value, color):
+        # the surfaces of f"{prefix}{value:.2f}" and where the number starts
+        prefix_surface = self.render(font, prefix, color)
+        value_surface = self.render(font, f"{value:.2f}", color)
+        return prefix_surface, value_surface, prefix_surface.get_width()
+
+    def label_size(self, font, prefix, value, color):
+        prefix_surface, value_surface, value_x = self.label(font, prefix, value, color)
+        return value_x + value_surface.get_width(), max(prefix_surface.get_height(), value_surface.get_height())
+
+    def draw_label(self, target, font, prefix, value, color, position):
+        x, y = position
+        prefix_surface, value_surface, value_x = self.label(font, prefix, value, color)
+        target.blit(prefix_surface, (x, y))
+        target.blit(value_surface, (x + value_x, y))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
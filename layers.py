@@ -0,0 +1,166 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+import pygame
+
+# Render targets shared across frames. Every surface the planet renderer
+# keeps goes through surface_pool, so its counters show how much a frame
+# allocates; the glow halo and the shading disk are baked once per distinct
+# look and blitted from LayerCache afterwards.
+
+
+def glow_params(asi):
+    # (glow colour, strongest alpha, ring spacing) of the halo for an ASI value
+    max_glow_alpha = min(255, 100 + int(asi * 1.55))
+
+    if asi < 5000:
+        glow_r = min(255, 200 + int(asi * 0.2))
+        glow_g = min(255, 200 + int(asi * 0.2))
+        glow_b = min(255, 220 + int(asi * 0.25))
+        layer_spacing = 15  # Fewer layers
+    elif 6000 <= asi <= 9000:
+        glow_r = min(255, 240 + int(asi * 0.3))
+        glow_g = min(255, 240 + int(asi * 0.3))
+        glow_b = min(255, 240 + int(asi * 0.3))
+        layer_spacing = 10
+    else:
+        glow_r = min(255, 250 + int(asi * 0.2))
+        glow_g = min(255, 250 + int(asi * 0.2))
+        glow_b = min(255, 255)
+        layer_spacing = 17
+
+    return (glow_r, glow_g, glow_b), max_glow_alpha, layer_spacing
+
+
+def glow_rings(radius, max_glow_alpha, layer_spacing):
+    # (ring radius, alpha) from the innermost ring out, all blitted in this order
+    return [(i, max(0, max_glow_alpha - (i - radius) * 5))  # Fade effect
+            for i in range(radius + 5, radius + 30, layer_spacing)]
+
+
+def shading_darkness(solar_intensity):
+    if solar_intensity < 20:
+        return 180  # Very light shading
+    elif 20 <= solar_intensity < 40:
+        return 100  # Light shading
+    elif 40 <= solar_intensity < 60:
+        return 70  # Moderate shading
+    elif 60 <= solar_intensity < 80:
+        return 60  # Darker shading
+    else:
+        return 30  # Very dark shading
+
+
+class SurfacePool:
+    def __init__(self, max_free=16):
+        self._lock = threading.Lock()  # layers are also built on worker threads
+        self.free = {}  # (size, flags, depth) -> surfaces ready for reuse
+        # every surface handed out -> its free-list key; weak, so a surface that
+        # is dropped instead of released takes its entry with it
+        self.keys = weakref.WeakKeyDictionary()
+        self.max_free = max_free
+        self.allocations = 0
+        self.bytes_allocated = 0
+        self.frame_allocations = 0
+        self.frame_bytes = 0
+        self.reuses = 0
+        self.frames = 0
+
+    def acquire(self, size, flags=0, depth=0, fill=None):
+        key = (tuple(size), flags, depth)
+        with self._lock:
+            free = self.free.get(key)
+            surface = free.pop() if free else None
+            if surface is not None:
+                self.reuses += 1
+        if surface is None:
+            surface = pygame.Surface(size, flags, depth) if depth else pygame.Surface(size, flags)
+            nbytes = surface.get_pitch() * surface.get_height()
+            with self._lock:
+                self.allocations += 1
+                self.bytes_allocated += nbytes
+                self.frame_allocations += 1
+                self.frame_bytes += nbytes
+        with self._lock:
+            self.keys[surface] = key
+        if fill is not None:
+            surface.fill(fill)
+        return surface
+
+    def release(self, surface):
+        with self._lock:
+            key = self.keys.pop(surface)
+            free = self.free.setdefault(key, [])
+            if len(free) < self.max_free:
+                free.append(surface)
+
+    def begin_frame(self):
+        self.frames += 1
+        self.frame_allocations = 0
+        self.frame_bytes = 0
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "allocations": self.allocations,
+            "bytes_allocated": self.bytes_allocated,
+            "frame_allocations": self.frame_allocations,
+            "frame_bytes": self.frame_bytes,
+            "reuses": self.reuses,
+        }
+
+
+surface_pool = SurfacePool()
+
+
+class LayerCache:
+    # Baked glow halos and shading disks, keyed by everything that changes
+    # their pixels, least recently used dropped first
+    def __init__(self, pool=surface_pool, max_entries=32):
+        self.pool = pool
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key, bake):
+        blits = self.entries.get(key)
+        if blits is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return blits
+        self.misses += 1
+        blits = bake()
+        self.entries[key] = blits
+        while len(self.entries) > self.max_entries:
+            for surface, _ in self.entries.popitem(last=False)[1]:
+                self.pool.release(surface)
+        return blits
+
+    def glow(self, center, radius, asi):
+        color, max_glow_alpha, layer_spacing = glow_params(asi)
+        key = ("glow", center, radius, color, max_glow_alpha, layer_spacing)
+        return self._get(key, lambda: self._bake_glow(center, radius, color, max_glow_alpha, layer_spacing))
+
+    def _bake_glow(self, center, radius, color, max_glow_alpha, layer_spacing):
+        # one surface per ring, cropped to the ring, so blitting them in order
+        # gives the same pixels as the old full-screen ring surfaces
+        center_x, center_y = center
+        blits = []
+        for i, alpha in glow_rings(radius, max_glow_alpha, layer_spacing):
+            surface = self.pool.acquire((2 * i + 1, 2 * i + 1), pygame.SRCALPHA, fill=(0, 0, 0, 0))
+            pygame.draw.circle(surface, color + (alpha,), (i, i), i)
+            blits.append((surface, (center_x - i, center_y - i)))
+        return blits
+
+    def shading(self, center, radius, solar_intensity):
+        darkness = shading_darkness(solar_intensity)
+        key = ("shading", center, radius, darkness)
+        return self._get(key, lambda: self._bake_shading(center, radius, darkness))
+
+    def _bake_shading(self, center, radius, darkness):
+        center_x, center_y = center
+        surface = self.pool.acquire((2 * radius, 2 * radius), pygame.SRCALPHA, fill=(0, 0, 0, 0))
+        pygame.draw.circle(surface, (0, 0, 0, darkness), (radius, radius), radius)
+        return [(surface, (center_x - radius, center_y - radius))]
@@ -0,0 +1,135 @@
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+
+import equations
+
+# Dense 4-D lookup table over the 0-100 slider box. The table is a plain .npy
+# file of shape (n, n, n, n, 19) that is memory-mapped on load, so queries cost
+# the same whatever the equations look like.
+#
+#   python lookup.py build --points 21 --out lookup_table.npy
+#   python lookup.py report --table lookup_table.npy
+
+DOMAIN = (0.0, 100.0)
+OUTPUT_NAMES = [name for name, _ in equations.DEPENDENT_VARIABLES]
+OUTPUT_LABELS = [label for _, label in equations.DEPENDENT_VARIABLES]
+
+# the 16 corners of a 4-D grid cell
+CORNERS = np.array(list(itertools.product((0, 1), repeat=4)))
+
+
+def build_table(path, points=21, dtype=np.float32):
+    axis = np.linspace(DOMAIN[0], DOMAIN[1], points)
+    table = np.lib.format.open_memmap(path, mode="w+", dtype=dtype,
+                                      shape=(points,) * 4 + (len(OUTPUT_NAMES),))
+    humidity, wind_speed, population = np.meshgrid(axis, axis, axis, indexing="ij")
+    # one solar_intensity slab at a time keeps memory at n^3 points
+    for i, solar_intensity in enumerate(axis):
+        values = equations.calculate_dependent_arrays(solar_intensity, humidity, wind_speed, population)
+        for k, name in enumerate(OUTPUT_NAMES):
+            table[i, ..., k] = values[name]
+    table.flush()
+    del table
+
+
+class LookupTable:
+    def __init__(self, path):
+        self.table = np.load(path, mmap_mode="r")
+        self.points = self.table.shape[0]
+        self.scale = (self.points - 1) / (DOMAIN[1] - DOMAIN[0])
+
+    def _cell(self, inputs):
+        position = (np.clip(inputs, *DOMAIN) - DOMAIN[0]) * self.scale
+        base = np.minimum(np.floor(position).astype(np.intp), self.points - 2)
+        return base, position - base
+
+    def query_batch(self, solar_intensity, humidity, wind_speed, population, method="linear"):
+        # Returns float values of shape (len(inputs), 19) in DEPENDENT_VARIABLES order
+        inputs = np.stack(np.broadcast_arrays(
+            *(np.atleast_1d(np.asarray(v, dtype=np.float64))
+              for v in (solar_intensity, humidity, wind_speed, population))), axis=-1)
+        if method == "nearest":
+            index = np.rint((np.clip(inputs, *DOMAIN) - DOMAIN[0]) * self.scale).astype(np.intp)
+            return np.asarray(self.table[index[:, 0], index[:, 1], index[:, 2], index[:, 3]], dtype=np.float64)
+        if method != "linear":
+            raise ValueError(f"unknown interpolation method {method!r}")
+
+        base, frac = self._cell(inputs)
+        result = np.zeros((len(inputs), len(OUTPUT_NAMES)))
+        for corner in CORNERS:
+            index = base + corner
+            weight = np.prod(np.where(corner, frac, 1 - frac), axis=1)
+            result += weight[:, None] * self.table[index[:, 0], index[:, 1], index[:, 2], index[:, 3]]
+        return result
+
+    def query(self, variables, method="linear"):
+        # Drop-in replacement for equations.calculate_dependent_variables
+        position = [(min(max(float(variables[name]), DOMAIN[0]), DOMAIN[1]) - DOMAIN[0]) * self.scale
+                    for name in equations.INDEPENDENT_VARIABLES]
+        if method == "nearest":
+            row = self.table[tuple(round(p) for p in position)]
+        elif method == "linear":
+            base = [min(int(p), self.points - 2) for p in position]
+            # the 2x2x2x2 cell is one slice; collapse it one axis at a time
+            row = np.asarray(self.table[tuple(slice(b, b + 2) for b in base)], dtype=np.float64)
+            for b, p in zip(base, position):
+                frac = p - b
+                row = row[0] * (1 - frac) + row[1] * frac
+        else:
+            raise ValueError(f"unknown interpolation method {method!r}")
+        return {label: int(value) for label, value in zip(OUTPUT_LABELS, row)}
+
+
+def report(path, samples=100_000, seed=0):
+    table = LookupTable(path)
+    print(f"table: {path}, {table.points}^4 points, {os.path.getsize(path) / 2**20:,.1f} MiB")
+
+    rng = np.random.default_rng(seed)
+    inputs = rng.uniform(*DOMAIN, size=(4, samples))
+    exact = equations.calculate_dependent_arrays(*inputs)
+    exact = np.stack([exact[name] for name in OUTPUT_NAMES], axis=1)
+
+    for method in ("nearest", "linear"):
+        start = time.perf_counter()
+        approx = table.query_batch(*inputs, method=method)
+        batch_time = (time.perf_counter() - start) / samples
+
+        queries = 2000
+        start = time.perf_counter()
+        for i in range(queries):
+            table.query(dict(zip(equations.INDEPENDENT_VARIABLES, inputs[:, i])), method=method)
+        single_time = (time.perf_counter() - start) / queries
+
+        print(f"\n{method}: {single_time * 1e6:.1f} us/query single, {batch_time * 1e6:.3f} us/query batched")
+        error = np.abs(approx - exact)
+        for k, label in enumerate(OUTPUT_LABELS):
+            print(f"  {label:22s} max error {error[:, k].max():14.4f}   mean {error[:, k].mean():12.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the dependent-variable lookup table.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="precompute the table")
+    build.add_argument("--points", type=int, default=21, help="grid points per axis (default 21, a step of 5)")
+    build.add_argument("--float64", action="store_true", help="store float64 instead of float32")
+    build.add_argument("--out", default="lookup_table.npy")
+    inspect = commands.add_parser("report", help="measure query latency and interpolation error")
+    inspect.add_argument("--table", default="lookup_table.npy")
+    inspect.add_argument("--samples", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        build_table(args.out, args.points, np.float64 if args.float64 else np.float32)
+        elapsed = time.perf_counter() - start
+        print(f"built {args.out} in {elapsed:.2f}s, {os.path.getsize(args.out) / 2**20:,.1f} MiB")
+    else:
+        report(args.table, args.samples)
+
+
+if __name__ == "__main__":
+    main()
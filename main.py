@@ -2,11 +2,21 @@ import math
 import random
 import pygame
 import os
-import pickle
+import threading
+from functools import partial
 from opensimplex import OpenSimplex
-import eq
-from functools import lru_cache
 import equations 
+from lookup import LookupTable
+from state import PlanetState, StateModel
+import terrain
+from terrain import GREEN
+from clouds import CloudLayer, cloud_opacity
+from layers import LayerCache, surface_pool
+from scheduler import RedrawScheduler
+from labels import TextCache
+from profiler import FrameProfiler
+from pipeline import Pipeline
+from snapshots import Autosaver, SnapshotStore, SNAPSHOT_FILE, HISTORY_FILE, LEGACY_FILE
 
 pygame.init()
 simplex = OpenSimplex(seed=42)
@@ -16,44 +26,114 @@ screenheight = 700
 screen = pygame.display.set_mode((SCREEN_WIDTH, screenheight))
 pygame.display.set_caption("Planet Habitability Simulation")
 clock = pygame.time.Clock()
+FPS = 60  # frame cap; the pipeline keeps slider drags at this rate while the worker recomputes
 
 terrain_cache = {}
+TERRAIN_CELL_SIZE = 3  # 1 gives per-pixel terrain
 planet_radius = min(SCREEN_WIDTH, SCREEN_HEIGHT) // 3
 
 WHITE = (255, 255, 255)
-GREEN = (34, 139, 34)
 BLUE = (0, 0, 255)
 GRAY = (100, 100, 100)
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
-SANDY = (205, 133, 63)
-BLUE1 = (70, 130, 180)  # Water
-LIGHT_GREEN = (144, 238, 144)  # Sparse plants
-BROWN = (139, 69, 19)  # Dry areas
 
 font = pygame.font.Font(None, 30)
+text_cache = TextCache()
+
+# F3 shows rolling per-stage frame times; PROFILE_EXPORT writes every frame's
+# stage times to a .csv or .jsonl file
+PROFILE_EXPORT = None
+PROFILER_KEY = pygame.K_F3
+profiler = FrameProfiler(["events", "stars", "model", "layout", "glow", "terrain", "shading", "clouds",
+                          "sliders", "dependent_variables", "buttons", "present"])
+profiler_font = pygame.font.Font(None, 20)
 
 # Independent variables (sliders)
-default_variables = {
-    "solar_intensity": 0,  
-    "humidity": 50,     
-    "wind_speed": 10,   
-    "population": 1000  
-}
-
-# Load saved variables if the file exists
-SAVE_FILE = "saved_variables.pkl"
-if os.path.exists(SAVE_FILE):
-    with open(SAVE_FILE, "rb") as file:
-        variables = pickle.load(file)
-        print("Variables saved:", variables)
-else:
-    variables = default_variables.copy()  
+default_variables = dict(equations.DEFAULT_VARIABLES)
+
+# Sliders are kept with snapshots.py: the newest saved state is loaded here
+# (an old saved_variables.pkl is migrated), slider changes are autosaved on a
+# background thread AUTOSAVE_DELAY seconds after the last one (None turns that
+# off), and PageUp/PageDown step through the saved history. PLANET_SAVE_DIR
+# moves all save files elsewhere; replay.py points it at a scratch directory
+AUTOSAVE_DELAY = 1.0
+SAVE_DIR = os.environ.get("PLANET_SAVE_DIR", "")
+HISTORY_BACK_KEY = pygame.K_PAGEUP
+HISTORY_FORWARD_KEY = pygame.K_PAGEDOWN
+snapshot_store = SnapshotStore(os.path.join(SAVE_DIR, SNAPSHOT_FILE), os.path.join(SAVE_DIR, HISTORY_FILE),
+                               os.path.join(SAVE_DIR, LEGACY_FILE), default_variables)
+variables = snapshot_store.load()
+if snapshot_store.source:
+    print(f"Variables loaded from {snapshot_store.source}:", variables)
+autosaver = Autosaver(snapshot_store, delay=AUTOSAVE_DELAY or 0.0)
+history_position = None  # index of the history entry being shown, None once the sliders move
+
 def save_variables():
-    with open(SAVE_FILE, "wb") as file:
-        pickle.dump(variables, file)
+    autosaver.save(variables)
     print("Variables saved:", variables)
 
+def autosave_variables():
+    global history_position
+    history_position = None
+    if AUTOSAVE_DELAY is not None:
+        autosaver.request(variables)
+
+def browse_history(step):
+    global history_position
+    count = len(snapshot_store.history)
+    if not count:
+        return
+    position = count if history_position is None else history_position
+    history_position = max(0, min(count - 1, position + step))
+    _, saved = snapshot_store.history[history_position]
+    variables.update(saved)
+    if AUTOSAVE_DELAY is not None:
+        autosaver.restore(variables)  # the state browsed to replaces any pending one
+
+# Path of a table built with `python lookup.py build` to answer the model from
+# the precomputed lookup table instead of evaluating the equations every frame
+LOOKUP_TABLE_FILE = None
+LOOKUP_METHOD = "linear"  # or "nearest"
+lookup_table = LookupTable(LOOKUP_TABLE_FILE) if LOOKUP_TABLE_FILE else None
+# The model evaluates in place into `frame_state`, whose outputs the frame
+# reads as attributes (frame_state.asi) or by display label (frame_state.labels["ASI"])
+model = StateModel()
+frame_state = PlanetState()
+frame_state.array[:] = math.nan  # nothing evaluated yet
+model_inputs = PlanetState()  # the sliders last handed to the pipeline
+model_inputs.array[:] = math.nan
+shown_result = None
+
+# The window evaluates the model and builds the planet layers on a worker
+# thread (see prepare_frame); the render loop draws the newest finished result
+PREPARE_IN_BACKGROUND = True
+pipeline = None
+
+def compute_dependent_variables(snapshot, state):
+    # the outputs for the sliders in snapshot, written into state
+    state.load_inputs(snapshot)
+    if lookup_table:
+        state.labels.update(lookup_table.query(snapshot, LOOKUP_METHOD))
+        return state
+    return model.evaluate(state)
+
+def evaluate_model():
+    # the model only runs again when a slider value actually changed
+    global shown_result
+    if pipeline is None:
+        if frame_state.load_inputs(variables):
+            with profiler.stage("model"):
+                compute_dependent_variables(variables, frame_state)
+        return frame_state
+    if model_inputs.load_inputs(variables):
+        pipeline.submit(dict(variables))
+    latest = pipeline.latest()
+    if latest is not None and latest[1] is not shown_result:
+        shown_result = latest[1]
+        frame_state.copy_from(shown_result)
+    return frame_state
+
 independent_sliders = [
     {"x": 50, "y": 150, "width": 300, "var": "solar_intensity", "label": "Solar Intensity (W/m²)"},
     {"x": 50, "y": 250, "width": 300, "var": "humidity", "label": "Humidity (%)"},
@@ -62,221 +142,196 @@ independent_sliders = [
 ]
 
 def draw_slider(x, y, width, value, label):
-    value = max(0, min(100, value))
-    value = int(round(value))  # Ensure value stays within the 0-100 range
-    pygame.draw.rect(screen, WHITE, (x, y + 3, width, 6))  # Background bar
-    handle_x = x + int((value / 100) * width)
-    pygame.draw.circle(screen, (224, 180, 74), (handle_x, y + 5), 8)  # Slider knob
-    text = font.render(f"{label}: {value:.2f}", True, WHITE)
-    screen.blit(text, (x, y - 25))
+    with profiler.stage("sliders"):
+        value = max(0, min(100, value))
+        value = int(round(value))  # Ensure value stays within the 0-100 range
+        pygame.draw.rect(screen, WHITE, (x, y + 3, width, 6))  # Background bar
+        handle_x = x + int((value / 100) * width)
+        pygame.draw.circle(screen, (224, 180, 74), (handle_x, y + 5), 8)  # Slider knob
+        text_cache.draw_label(screen, font, f"{label}: ", value, WHITE, (x, y - 25))
+
+def slider_bounds(x, y, width, value, label):
+    text_width, text_height = text_cache.label_size(font, f"{label}: ", value, WHITE)
+    return pygame.Rect(x - 9, y - 25, width + 19, 40).union((x, y - 25, text_width, text_height))
 
 center_x, center_y = SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2
-previous_terrain = {}
-
-solar_intensity = variables["solar_intensity"]#dependent_variables.get("solar_intensity") / 100
-@lru_cache(maxsize=None)
-
-def get_terrain_color(noise_value, rainfall, plant_density):
-    # Adjust plant density effect
-    if plant_density < 50:
-        plant_factor = plant_density / 50  # Gradually fades to brown
-    elif plant_density > 500:
-        plant_factor = max(0, (200 - plant_density) / 100)#max(0, 1 - (plant_density - 100) / 100)  # Gradually turns brown again
-    else:
-        plant_factor = 1  # Most green in 50-100 range
-
-    # Adjust rainfall effect
-    if rainfall < 80000:
-        rain_factor = 0  # No blue for very low rainfall
-    elif rainfall > 90000:
-        rain_factor = max(0, 1 - (rainfall - 90000) / 10000)  # Gradually fades out above 90000
-    else:
-        rain_factor = (rainfall - 80000) / (90000 - 80000)  # Most blue in 80000-90000 range
-
-    if noise_value < -0.1:
-        transition = plant_factor  # Use adjusted plant density
-        r = int(BROWN[0] * (1 - transition) + GREEN[0] * transition)
-        g = int(BROWN[1] * (1 - transition) + GREEN[1] * transition)
-        b = int(BROWN[2] * (1 - transition) + GREEN[2] * transition)
-    elif noise_value < 0:
-        transition = rain_factor  # Use adjusted rainfall
-        r = int(SANDY[0] * (1 - transition) + LIGHT_GREEN[0] * transition)
-        g = int(SANDY[1] * (1 - transition) + LIGHT_GREEN[1] * transition)
-        b = int(SANDY[2] * (1 - transition) + LIGHT_GREEN[2] * transition)
-    else:
-        transition = rain_factor  # Use adjusted rainfall
-        r = int(BROWN[0] * (1 - transition) + BLUE1[0] * transition)
-        g = int(BROWN[1] * (1 - transition) + BLUE1[1] * transition)
-        b = int(BROWN[2] * (1 - transition) + BLUE1[2] * transition)
-
-    return (max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b)))
-
-noise_map = {}
-
-def get_noise_value(x, y):
-    if (x, y) in noise_map:
-        return noise_map[(x, y)]
-    
-    noise_value = simplex.noise2(x / 50, y / 50) + 0.5 * simplex.noise2(x / 30, y / 30) + 0.25 * simplex.noise2(x / 10, y / 10)
-    
-    noise_map[(x, y)] = noise_value
-    return noise_value
-
-
-CLOUD_COLOR = (255, 255, 255, 60) 
+
 cloud_noise_offset = 0  
 
+cloud_layers = {}
+layer_lock = threading.Lock()  # layers are built by the render thread or the pipeline worker
+
+def cloud_layer(radius):
+    adjusted_radius = min(radius, planet_radius)  
+    with layer_lock:
+        layer = cloud_layers.get(adjusted_radius)
+        if layer is None:
+            layer = CloudLayer(simplex, (center_x, center_y), adjusted_radius)
+            cloud_layers[adjusted_radius] = layer
+    return layer
+
 def draw_clouds(radius, cloud_density):
+    layer = cloud_layer(radius)
+    wind_step = variables["wind_speed"] * 0.2  # Wind effect
+    with profiler.stage("clouds"):
+        # with the pipeline running a frame never waits for cloud noise
+        layer.draw(screen, cloud_noise_offset, wind_step, cloud_opacity(cloud_density), wait=pipeline is None)
+
+def move_clouds():
     global cloud_noise_offset
-    cloud_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+    cloud_noise_offset += variables["wind_speed"] * 0.2
 
-    adjusted_radius = min(radius, planet_radius)  
-    if cloud_density < 100:
-        cloud_opacity = 5
-    elif cloud_density < 150:
-        cloud_opacity = 50
-    elif cloud_density < 200:
-        cloud_opacity = 60
-    elif cloud_density < 400:
-        cloud_opacity = 70
-    elif cloud_density < 1000:
-        cloud_opacity = 90
-    elif cloud_density < 2000:
-        cloud_opacity = 120
-    elif cloud_density < 3000:
-        cloud_opacity = 140
-    elif cloud_density < 6000:
-        cloud_opacity = 160
-    else:
-        cloud_opacity = 170 # Best whiteness at 600+
-
-    cloud_color = (255, 255, 255, cloud_opacity)  
-
-    for y in range(int(center_y - adjusted_radius), int(center_y + adjusted_radius), 5):
-        for x in range(int(center_x - adjusted_radius), int(center_x + adjusted_radius), 5):
-            distance = math.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
-            if distance <= adjusted_radius:
-                noise_value = simplex.noise2((x + cloud_noise_offset) / 80, (y + cloud_noise_offset) / 80)
-                if noise_value > 0.2:  
-                    pygame.draw.circle(cloud_surface, cloud_color, (x, y), 5)
-
-    screen.blit(cloud_surface, (0, 0))
-    cloud_noise_offset += variables["wind_speed"] * 0.2  # Wind effect
+baked_layers = LayerCache()
 
 def draw_shading_overlay(radius, solar_intensity):
-    if solar_intensity < 20:
-        darkness = 180  # Very light shading
-    elif 20 <= solar_intensity < 40:
-        darkness = 100  # Light shading
-    elif 40 <= solar_intensity < 60:
-        darkness = 70  # Moderate shading
-    elif 60 <= solar_intensity < 80:
-        darkness = 60  # Darker shading
-    else:
-        darkness = 30  # Very dark shading
-
-    shading_surface = pygame.Surface((2 * radius, 2 * radius), pygame.SRCALPHA)
-    pygame.draw.circle(shading_surface, (0, 0, 0, darkness), (radius, radius), radius)
-
-    screen.blit(shading_surface, (center_x - radius, center_y - radius))
+    with profiler.stage("shading"):
+        for shading_surface, position in baked_layers.shading((center_x, center_y), radius, solar_intensity):
+            screen.blit(shading_surface, position)
 
 def draw_planet(radius, rainfall, plant_density, asi, cloud_density):
     center_x, center_y = SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2
-    max_glow_alpha = min(255, 100 + int(asi * 1.55))
-
-    if asi < 5000:
-        glow_r = min(255, 200 + int(asi * 0.2))  
-        glow_g = min(255, 200 + int(asi * 0.2))
-        glow_b = min(255, 220 + int(asi * 0.25))
-        layer_spacing = 15  # Fewer layers
-    elif 6000 <= asi <= 9000:
-        glow_r = min(255, 240 + int(asi * 0.3))  
-        glow_g = min(255, 240 + int(asi * 0.3))
-        glow_b = min(255, 240 + int(asi * 0.3))
-        layer_spacing = 10  
-    else:
-        glow_r = min(255, 250 + int(asi * 0.2))  
-        glow_g = min(255, 250 + int(asi * 0.2))
-        glow_b = min(255, 255)
-        layer_spacing = 17 
-
-    for i in range(radius + 5, radius + 30, layer_spacing):  
-        alpha = max(0, max_glow_alpha - (i - radius) * 5)  # Fade effect
-        glow_color = (glow_r, glow_g, glow_b, alpha)
-        glow_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        pygame.draw.circle(glow_surface, glow_color, (center_x, center_y), i)
-        screen.blit(glow_surface, (0, 0))
-
-    for y in range(center_y - radius, center_y + radius, 3):
-        for x in range(center_x - radius, center_x + radius, 3):
-            distance = math.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
-            if distance <= radius:
-                noise_value = get_noise_value(x, y)  
-                color = get_terrain_color(noise_value, rainfall, plant_density)
-                pygame.draw.rect(screen, color, (x, y, 3, 3))
+    with profiler.stage("glow"):
+        for glow_surface, position in baked_layers.glow((center_x, center_y), radius, asi):
+            screen.blit(glow_surface, position)
+
+    with profiler.stage("terrain"):
+        terrain_raster(radius).draw(screen, rainfall, plant_density)
 
     draw_shading_overlay(radius, variables["solar_intensity"])
     draw_clouds(radius, cloud_density)
 
-
-def draw_dependent_variables(dependent_variables):
+def terrain_raster(radius):
+    with layer_lock:
+        raster = terrain_cache.get((radius, TERRAIN_CELL_SIZE))
+        if raster is None:
+            raster = terrain.TerrainRaster(simplex, (center_x, center_y), radius, TERRAIN_CELL_SIZE)
+            terrain_cache[(radius, TERRAIN_CELL_SIZE)] = raster
+    return raster
+
+def prepare_frame(snapshot):
+    # Runs on the pipeline worker for a slider snapshot: the model, plus the
+    # terrain raster, its palette and the cloud layer the planet will need
+    prepared = compute_dependent_variables(snapshot, PlanetState())
+    plants_density = max(0, min(100, prepared.plants_density))
+    terrain_raster(200)
+    terrain.band_colors(prepared.rainfall_area, plants_density)
+    cloud_layer(200).prefetch(cloud_noise_offset, snapshot["wind_speed"] * 0.2)
+    return prepared
+
+def planet_bounds(radius):
+    # the outermost glow ring stays inside radius + 30
+    return pygame.Rect(center_x - radius - 30, center_y - radius - 30, 2 * radius + 61, 2 * radius + 61)
+
+
+def dependent_variable_bars(dependent_variables):
     y_offset = 80
     bar_width = 250
     x_offset = SCREEN_WIDTH - 350
     vertical_spacing = 30
 
+    bars = []
     for key, value in dependent_variables.items():
         if y_offset + vertical_spacing > screenheight - 50:
             break
-        draw_horizontal_bar(x_offset, y_offset, bar_width, value, key)
+        bars.append((x_offset, y_offset, bar_width, value, key))
         y_offset += vertical_spacing
+    return bars
+
+def draw_dependent_variables(dependent_variables):
+    for bar in dependent_variable_bars(dependent_variables):
+        draw_horizontal_bar(*bar)
 
 
 def draw_horizontal_bar(x, y, width, value, label):
-    bar_height = 5
-    bar_value = int(min(width, max(0, (value / 100) * width)))
-    pygame.draw.rect(screen, GRAY, (x, y, width, bar_height), border_radius=3)
-    pygame.draw.rect(screen, (224, 180, 74), (x, y, bar_value, bar_height), border_radius=3)
-    text = font.render(f"{label}: {value:.2f}", True, WHITE)
-    screen.blit(text, (x, y - 20))
+    with profiler.stage("dependent_variables"):
+        bar_height = 5
+        bar_value = int(min(width, max(0, (value / 100) * width)))
+        pygame.draw.rect(screen, GRAY, (x, y, width, bar_height), border_radius=3)
+        pygame.draw.rect(screen, (224, 180, 74), (x, y, bar_value, bar_height), border_radius=3)
+        text_cache.draw_label(screen, font, f"{label}: ", value, WHITE, (x, y - 20))
+
+def bar_bounds(x, y, width, value, label):
+    text_width, text_height = text_cache.label_size(font, f"{label}: ", value, WHITE)
+    return pygame.Rect(x, y - 20, width, 25).union((x, y - 20, text_width, text_height))
 
 
 def reset_variables():
     global variables
     variables = default_variables.copy()
+    autosave_variables()
 
 def draw_button(x, y, width, height, text, color, hover_color, is_hovering):
-    button_color = hover_color if is_hovering else color
-    pygame.draw.rect(screen, button_color, (x, y, width, height))
-    text_surface = font.render(text, True, WHITE)
-    text_x = x + (width - text_surface.get_width()) // 2
-    text_y = y + (height - text_surface.get_height()) // 2
-    screen.blit(text_surface, (text_x, text_y))
+    with profiler.stage("buttons"):
+        button_color = hover_color if is_hovering else color
+        pygame.draw.rect(screen, button_color, (x, y, width, height))
+        text_surface = text_cache.render(font, text, WHITE)
+        text_x = x + (width - text_surface.get_width()) // 2
+        text_y = y + (height - text_surface.get_height()) // 2
+        screen.blit(text_surface, (text_x, text_y))
 
 num_stars = 120
 stars = [(random.randint(0, SCREEN_WIDTH), random.randint(0, screenheight), random.uniform(0.5, 2), random.randint(1, 3)) for _ in range(num_stars)]
 
-def draw_stars():
-    for i in range(len(stars)):
-        x, y, speed, size = stars[i]
-        
-        if random.random() < 0.08:  
-            size = random.randint(1, 3)
-        
-        pygame.draw.circle(screen, WHITE, (int(x), y), size)
+star_bounds = []
+
+def twinkle_stars():
+    global star_bounds
+    with profiler.stage("stars"):
+        for i in range(len(stars)):
+            x, y, speed, size = stars[i]
+            
+            if random.random() < 0.08:  
+                size = random.randint(1, 3)
+            stars[i] = (x, y, speed, size)
+        star_bounds = [pygame.Rect(int(x) - size - 1, y - size - 1, 2 * size + 3, 2 * size + 3)
+                       for x, y, _, size in stars]
+
+def draw_stars(area):
+    with profiler.stage("stars"):
+        for i in area.collidelistall(star_bounds):
+            x, y, speed, size = stars[i]
+            pygame.draw.circle(screen, WHITE, (int(x), y), size)
+
+def move_stars():
+    with profiler.stage("stars"):
+        for i in range(len(stars)):
+            x, y, speed, size = stars[i]
+            x = (x + 1) % SCREEN_WIDTH
+            stars[i] = (x, y, speed, size)  # U
 
-        x = (x + 1) % SCREEN_WIDTH
-        stars[i] = (x, y, speed, size)  # U
 
-
-running = True
 dragging_slider = None
-while running:
-    screen.fill(BLACK)
-    draw_stars() 
-    for event in pygame.event.get():
+scheduler = RedrawScheduler()
+
+def drag_slider(slider, mouse_x):
+    x, y, width, var, _ = slider.values()
+    relative_x = mouse_x - x
+    value = max(0, min(100, (relative_x / width) * 100))
+    variables[var] = value
+    autosave_variables()
+
+def handle_events(events):
+    # All mouse motion of one frame collapses into a single slider update
+    global dragging_slider
+    running = True
+    drag_x = None
+    for event in events:
+        if event.type == pygame.MOUSEMOTION:
+            if dragging_slider:
+                drag_x = event.pos[0]
+            continue
+        if drag_x is not None:
+            drag_slider(dragging_slider, drag_x)
+            drag_x = None
+
         if event.type == pygame.QUIT:
             running = False
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED):
+            scheduler.invalidate()
+        elif event.type == pygame.KEYDOWN and event.key == PROFILER_KEY:
+            profiler.toggle_overlay()
+        elif event.type == pygame.KEYDOWN and event.key in (HISTORY_BACK_KEY, HISTORY_FORWARD_KEY):
+            browse_history(-1 if event.key == HISTORY_BACK_KEY else 1)
         elif event.type == pygame.MOUSEBUTTONDOWN:
             for slider in independent_sliders:
                 x, y, width, var, _ = slider.values()
@@ -289,35 +344,125 @@ while running:
 
         elif event.type == pygame.MOUSEBUTTONUP:
             dragging_slider = None
-
-        elif event.type == pygame.MOUSEMOTION and dragging_slider:
-            x, y, width, var, _ = dragging_slider.values()
-            relative_x = event.pos[0] - x
-            value = max(0, min(100, (relative_x / width) * 100))
-            variables[var] = value
-
-    dependent_variables = equations.calculate_dependent_variables(variables)
-
-    plants_density = max(0, min(100, dependent_variables.get("Plants Density"))) 
-    rainfall_area = dependent_variables.get("Rainfall Area") 
-    asi = dependent_variables.get("ASI") 
-    cloud_density = int(dependent_variables.get("Cloud Density"))
-    rainfall_intensity = dependent_variables.get("Rainfall Intensity")
-
-    draw_planet(200, rainfall_area,plants_density, asi, cloud_density)
+    if drag_x is not None:
+        drag_slider(dragging_slider, drag_x)
+    return running
+
+frame_layers = []
+layer_bounds = []
+
+def update_frame(mouse_pos):
+    # Advances the stars and the model to this frame and lays out everything
+    # drawn over the stars as (name, state, bounds, draw), in drawing order
+    surface_pool.begin_frame()
+    twinkle_stars()
+    outputs = evaluate_model()
+
+    plants_density = max(0, min(100, outputs.plants_density))
+    rainfall_area = outputs.rainfall_area
+    asi = outputs.asi
+    cloud_density = int(outputs.cloud_density)
+
+    with profiler.stage("layout"):
+        layout_layers(mouse_pos, rainfall_area, plants_density, asi, cloud_density)
+    return frame_layers
+
+def layout_layers(mouse_pos, rainfall_area, plants_density, asi, cloud_density):
+    global frame_layers, layer_bounds
+    planet = (rainfall_area, plants_density, asi, cloud_density)
+    planet_state = planet + (variables["solar_intensity"], round(cloud_noise_offset))
+    frame_layers = [("planet", planet_state, planet_bounds(200), partial(draw_planet, 200, *planet))]
 
     for slider in independent_sliders:
-        draw_slider(slider["x"], slider["y"], slider["width"], variables[slider["var"]], slider["label"])
+        x, y, width, var, label = slider.values()
+        value = int(round(max(0, min(100, variables[var]))))
+        frame_layers.append((var, value, slider_bounds(x, y, width, value, label),
+                             partial(draw_slider, x, y, width, value, label)))
 
-    draw_dependent_variables(dependent_variables)
+    for bar in dependent_variable_bars(frame_state.labels):
+        frame_layers.append((bar[4], bar[3], bar_bounds(*bar), partial(draw_horizontal_bar, *bar)))
 
-    mouse_pos = pygame.mouse.get_pos()
     is_hovering_default = 50 <= mouse_pos[0] <= 170 and 500 <= mouse_pos[1] <= 540
-    is_hovering_save = 200 <= mouse_pos[0] <= 320 and 500 <= event.pos[1] <= 540
-    draw_button(50, 500, 120, 40, "Default", GRAY, (194, 197, 204), is_hovering_default)
-    draw_button(200, 500, 120, 40, "Save", GREEN, (100, 255, 100), is_hovering_save)
-
-    pygame.display.flip()
-    clock.tick(30)
-
-pygame.quit()
+    is_hovering_save = 200 <= mouse_pos[0] <= 320 and 500 <= mouse_pos[1] <= 540
+    frame_layers.append(("default_button", is_hovering_default, pygame.Rect(50, 500, 120, 40),
+                         partial(draw_button, 50, 500, 120, 40, "Default", GRAY, (194, 197, 204), is_hovering_default)))
+    frame_layers.append(("save_button", is_hovering_save, pygame.Rect(200, 500, 120, 40),
+                         partial(draw_button, 200, 500, 120, 40, "Save", GREEN, (100, 255, 100), is_hovering_save)))
+
+    profiler.update_overlay(profiler_font)
+    frame_layers.append(("profiler", profiler.overlay_version, pygame.Rect((10, 10), profiler.overlay_size()),
+                         draw_profiler_overlay))
+    layer_bounds = [bounds for _, _, bounds, _ in frame_layers]
+
+def draw_profiler_overlay():
+    profiler.draw_overlay(screen, (10, 10))
+
+def paint(area):
+    # Draws everything of the current frame that overlaps `area`
+    screen.fill(BLACK, area)
+    draw_stars(area)
+    for i in area.collidelistall(layer_bounds):
+        frame_layers[i][3]()
+
+def finish_frame():
+    move_stars()
+    move_clouds()
+
+def draw_frame(mouse_pos):
+    # Draws one full frame of the current `variables` onto `screen`, which can
+    # be the window or an offscreen surface (see render.py)
+    update_frame(mouse_pos)
+    paint(screen.get_rect())
+    finish_frame()
+
+def redraw(mouse_pos):
+    # Same frame as draw_frame, but only the areas that changed since the last
+    # one are painted; returns them for pygame.display.update
+    for name, state, bounds, _ in update_frame(mouse_pos):
+        scheduler.track(name, state, bounds)
+    for i, bounds in enumerate(star_bounds):
+        scheduler.track(("star", i), None, bounds)
+    rects = scheduler.flush(screen, paint)
+    finish_frame()
+    return rects
+
+def start():
+    global pipeline
+    if PROFILE_EXPORT:
+        profiler.open_export(PROFILE_EXPORT)
+    if PREPARE_IN_BACKGROUND:
+        pipeline = Pipeline(prepare_frame)
+        evaluate_model()  # submits the starting sliders
+        pipeline.wait()  # so the first frame already has the model and layers
+
+def run_frame(events, mouse_pos):
+    # one pass of the main loop for this frame's events; False once the window is closed.
+    # replay.py drives the loop through here with recorded events
+    profiler.begin_frame()
+    with profiler.stage("events"):
+        running = handle_events(events)
+    rects = redraw(mouse_pos)
+
+    with profiler.stage("present"):
+        pygame.display.update(rects)
+    profiler.end_frame()
+    return running
+
+def stop():
+    profiler.close_export()
+    if pipeline is not None:
+        pipeline.close()
+    autosaver.close()  # writes a change still waiting for its delay
+
+def run():
+    start()
+    running = True
+    while running:
+        running = run_frame(pygame.event.get(), pygame.mouse.get_pos())
+        clock.tick(FPS)
+    stop()
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,278 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+import compiler
+import equations
+
+# Monte Carlo uncertainty propagation: the four sliders are drawn from
+# distributions, the model is evaluated on large batches of samples and every
+# output is folded into a Summary (count, mean, variance, min/max and a fixed
+# histogram for quantiles). Summaries merge exactly, so workers each summarise
+# their share and only summaries come back; memory does not grow with the
+# sample count.
+#
+#   python montecarlo.py --samples 100000000 --workers 8
+#   python montecarlo.py --input humidity=normal:60:8 --input population=uniform:5:15 --outputs asi,hunger
+
+DISTRIBUTIONS = {
+    # name: (parameters, sampler(rng, size, *parameters))
+    "fixed": (("value",), lambda rng, size, value: np.full(size, value, dtype=np.float64)),
+    "uniform": (("low", "high"), lambda rng, size, low, high: rng.uniform(low, high, size)),
+    "normal": (("mean", "std"), lambda rng, size, mean, std: rng.normal(mean, std, size)),
+    "lognormal": (("mean", "sigma"), lambda rng, size, mean, sigma: rng.lognormal(mean, sigma, size)),
+    "triangular": (("low", "mode", "high"),
+                   lambda rng, size, low, mode, high: rng.triangular(low, mode, high, size)),
+}
+DEFAULT_INPUTS = {
+    "solar_intensity": ("normal", (50.0, 5.0)),
+    "humidity": ("normal", (50.0, 5.0)),
+    "wind_speed": ("normal", (10.0, 2.0)),
+    "population": ("normal", (10.0, 1.0)),
+}
+SLIDER_RANGE = (0.0, 100.0)
+OUTPUTS = [name for name, _ in equations.DEPENDENT_VARIABLES]
+HISTOGRAM_BINS = 2048
+RESOLUTION = 1e-6  # finest histogram bin as a fraction of an output's range
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def parse_input(text):
+    # NAME=DIST:P1:P2..., e.g. humidity=normal:60:8
+    name, _, spec = text.partition("=")
+    if name not in equations.INDEPENDENT_VARIABLES:
+        raise argparse.ArgumentTypeError(f"unknown variable {name!r}")
+    kind, *values = spec.split(":")
+    if kind not in DISTRIBUTIONS:
+        raise argparse.ArgumentTypeError(f"unknown distribution {kind!r}, expected one of {', '.join(DISTRIBUTIONS)}")
+    parameters = DISTRIBUTIONS[kind][0]
+    try:
+        values = tuple(float(value) for value in values)
+    except ValueError:
+        values = ()
+    if len(values) != len(parameters):
+        raise argparse.ArgumentTypeError(f"expected {name}={kind}:{':'.join(parameters)}, got {text!r}")
+    return name, (kind, values)
+
+
+def output_ranges(model=compiler.MODEL):
+    # the clamp bounds of every output; an unclamped alias takes its source's
+    bounds = {output: (low, high) for output, _, _, low, high in model}
+    for output, _, expression, low, high in model:
+        if low is None and expression in bounds:
+            bounds[output] = bounds[expression]
+    return [bounds[name] for name in OUTPUTS]
+
+
+class Summary:
+    # Streaming statistics of the outputs. Histogram bins are equal steps of
+    # log1p((value - low) / scale) between each output's clamp bounds, which
+    # keeps the relative error of a quantile about the same for small and huge
+    # outputs.
+    def __init__(self, ranges=None, bins=HISTOGRAM_BINS):
+        ranges = output_ranges() if ranges is None else ranges
+        self.low = np.array([low for low, _ in ranges], dtype=np.float64)
+        # bins stay about RESOLUTION * (high - low) wide near the low bound
+        self.scale = np.array([(high - low) * RESOLUTION for low, high in ranges], dtype=np.float64)
+        self.span = np.log1p(1 / RESOLUTION)
+        self.bins = bins
+        self.count = 0
+        self.mean = np.zeros(len(ranges))
+        self.m2 = np.zeros(len(ranges))  # sum of squared deviations from the mean
+        self.minimum = np.full(len(ranges), np.inf)
+        self.maximum = np.full(len(ranges), -np.inf)
+        self.histogram = np.zeros((len(ranges), bins), dtype=np.int64)
+
+    def add(self, values):
+        # values: (outputs, samples)
+        count = values.shape[1]
+        if count == 0:
+            return
+        mean = values.mean(axis=1)
+        m2 = ((values - mean[:, None]) ** 2).sum(axis=1)
+        self._combine(count, mean, m2)
+        np.minimum(self.minimum, values.min(axis=1), out=self.minimum)
+        np.maximum(self.maximum, values.max(axis=1), out=self.maximum)
+
+        position = np.log1p(np.maximum(values - self.low[:, None], 0) / self.scale[:, None])
+        position *= self.bins / self.span
+        index = np.minimum(position.astype(np.int64), self.bins - 1)
+        index += (self.bins * np.arange(len(self.low)))[:, None]
+        self.histogram += np.bincount(index.ravel(), minlength=self.histogram.size).reshape(self.histogram.shape)
+
+    def _combine(self, count, mean, m2):
+        # Chan et al.'s pairwise update of the mean and squared deviations
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * (count / total)
+        self.m2 += m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        self._combine(other.count, other.mean, other.m2)
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.histogram += other.histogram
+        return self
+
+    def variance(self):
+        return self.m2 / max(self.count - 1, 1)
+
+    def quantiles(self, probabilities=QUANTILES):
+        # (outputs, len(probabilities)), linear inside the bin the rank falls in
+        # and kept within the observed min/max
+        cumulative = np.cumsum(self.histogram, axis=1)
+        result = np.empty((len(self.low), len(probabilities)))
+        for column, probability in enumerate(probabilities):
+            rank = probability * self.count
+            for row in range(len(self.low)):
+                index = min(int(np.searchsorted(cumulative[row], rank)), self.bins - 1)
+                below = cumulative[row, index - 1] if index else 0
+                inside = self.histogram[row, index]
+                fraction = (rank - below) / inside if inside else 0.0
+                position = (index + fraction) * self.span / self.bins
+                result[row, column] = self.low[row] + self.scale[row] * np.expm1(position)
+        return np.clip(result, self.minimum[:, None], self.maximum[:, None])
+
+    def edges(self, row):
+        return self.low[row] + self.scale[row] * np.expm1(np.linspace(0, self.span, self.bins + 1))
+
+    def to_json(self, names=OUTPUTS, probabilities=QUANTILES, histogram=False):
+        quantiles = self.quantiles(probabilities)
+        std = np.sqrt(self.variance())
+        result = {}
+        for name in names:
+            row = OUTPUTS.index(name)
+            entry = {
+                "mean": float(self.mean[row]),
+                "std": float(std[row]),
+                "min": float(self.minimum[row]),
+                "max": float(self.maximum[row]),
+                "quantiles": {f"{probability:g}": float(value)
+                              for probability, value in zip(probabilities, quantiles[row])},
+            }
+            if histogram:
+                entry["histogram"] = {"edges": self.edges(row).tolist(), "counts": self.histogram[row].tolist()}
+            result[name] = entry
+        return {"samples": self.count, "outputs": result}
+
+
+def sample_inputs(inputs, rng, size, clip=True):
+    columns = []
+    for name in equations.INDEPENDENT_VARIABLES:
+        kind, parameters = inputs[name]
+        values = DISTRIBUTIONS[kind][1](rng, size, *parameters)
+        if clip:
+            values = np.clip(values, *SLIDER_RANGE, out=values)
+        columns.append(values)
+    return columns
+
+
+_model = None
+
+
+def evaluate_task(inputs, seed, task, samples, batch_size, clip):
+    # One work item: its own random stream (seeded by the task number, so
+    # results do not depend on the worker count) summarised batch by batch
+    global _model
+    if _model is None:
+        _model = compiler.compile_numpy()
+    rng = np.random.default_rng([seed, task])
+    summary = Summary()
+    values = np.empty((len(OUTPUTS), batch_size))
+    for begin in range(0, samples, batch_size):
+        size = min(batch_size, samples - begin)
+        outputs = _model(*sample_inputs(inputs, rng, size, clip))
+        for row, name in enumerate(OUTPUTS):
+            values[row, :size] = outputs[name]
+        summary.add(values[:, :size])
+    return summary
+
+
+def run_montecarlo(inputs, samples, seed=0, workers=1, task_size=4_000_000, batch_size=100_000, clip=True,
+                   progress=True):
+    tasks = [(task, min(task_size, samples - begin)) for task, begin in enumerate(range(0, samples, task_size))]
+    summary = Summary()
+    start = last_report = time.perf_counter()
+
+    def collect(result):
+        nonlocal last_report
+        summary.merge(result)
+        now = time.perf_counter()
+        if progress and now - last_report >= 1.0:
+            last_report = now
+            print(f"{summary.count}/{samples} samples ({100 * summary.count / samples:.1f}%), "
+                  f"{summary.count / (now - start):,.0f} samples/s", file=sys.stderr)
+
+    if workers <= 1:
+        for task, count in tasks:
+            collect(evaluate_task(inputs, seed, task, count, batch_size, clip))
+    else:
+        # a few tasks in flight per worker, like sweep.py
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for task, count in tasks:
+                pending.add(pool.submit(evaluate_task, inputs, seed, task, count, batch_size, clip))
+                if len(pending) >= 2 * workers:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        collect(future.result())
+            for future in pending:
+                collect(future.result())
+    return summary, time.perf_counter() - start
+
+
+def print_summary(summary, names, out=sys.stdout):
+    quantiles = summary.quantiles()
+    std = np.sqrt(summary.variance())
+    header = "".join(f"{label:>13}" for label in ["mean", "std", "min"] + [f"p{100 * q:g}" for q in QUANTILES] + ["max"])
+    print(f"{'output':<22}{header}", file=out)
+    for name in names:
+        row = OUTPUTS.index(name)
+        values = [summary.mean[row], std[row], summary.minimum[row], *quantiles[row], summary.maximum[row]]
+        print(f"{name:<22}" + "".join(f"{value:13.5g}" for value in values), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Propagate slider uncertainty through the model by sampling.")
+    parser.add_argument("--input", type=parse_input, action="append", default=[], metavar="NAME=DIST:P1:P2",
+                        help=f"distribution of one slider ({', '.join(DISTRIBUTIONS)}), e.g. humidity=normal:60:8")
+    parser.add_argument("--samples", type=int, default=10_000_000, help="number of samples (default 10^7)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default 1)")
+    parser.add_argument("--batch-size", type=int, default=100_000, help="samples evaluated at once")
+    parser.add_argument("--no-clip", action="store_true", help="do not clamp samples to the 0-100 slider range")
+    parser.add_argument("--outputs", help="comma-separated outputs to print (default: all)")
+    parser.add_argument("--out", help="write the summary as JSON")
+    parser.add_argument("--histogram", action="store_true", help="include the histograms in the JSON")
+    args = parser.parse_args(argv)
+
+    inputs = dict(DEFAULT_INPUTS)
+    inputs.update(args.input)
+    names = OUTPUTS if not args.outputs else args.outputs.split(",")
+    for name in names:
+        if name not in OUTPUTS:
+            parser.error(f"unknown output {name!r}")
+    for name in equations.INDEPENDENT_VARIABLES:
+        kind, parameters = inputs[name]
+        print(f"{name:<16} {kind}({', '.join(f'{value:g}' for value in parameters)})", file=sys.stderr)
+
+    summary, elapsed = run_montecarlo(inputs, args.samples, args.seed, args.workers, batch_size=args.batch_size,
+                                      clip=not args.no_clip)
+    print_summary(summary, names)
+    print(f"{summary.count} samples in {elapsed:.2f}s: {summary.count / elapsed:,.0f} samples/s")
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump({"inputs": {name: {"distribution": kind, "parameters": list(parameters)}
+                                  for name, (kind, parameters) in inputs.items()},
+                       "seed": args.seed, **summary.to_json(histogram=args.histogram)}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import argparse
+import re
+import sys
+import time
+
+import numpy as np
+
+import compiler
+import equations
+from montecarlo import output_ranges
+from snapshots import SNAPSHOT_FILE, SnapshotStore
+
+# Inverse solver: finds slider settings that maximise or minimise outputs
+# subject to bounds on other outputs, e.g. the highest ASI with Hunger and
+# Thirst under 1. The clamps and the crop-yield branch make the model flat or
+# kinked in places, so the search uses no derivatives: a coarse pass over the
+# input box (a grid that includes the box edges plus random points) followed by
+# rounds of mutation around the current Pareto front with a shrinking step.
+# Each round is one batched call of the compiled NumPy model.
+#
+#   python optimizer.py --maximize ASI --constraint "Hunger<=1" --constraint "Thirst<=1"
+#   python optimizer.py --maximize asi --minimize pollution --fix population=10 --apply 0
+
+INPUTS = equations.INDEPENDENT_VARIABLES
+OUTPUTS = [name for name, _ in equations.DEPENDENT_VARIABLES]
+LABELS = {label.lower(): name for name, label in equations.DEPENDENT_VARIABLES}
+SLIDER_RANGE = (0.0, 100.0)
+SAVE_FILE = SNAPSHOT_FILE  # the file main.py loads its sliders from
+CONSTRAINT = re.compile(r"^\s*(.+?)\s*(<=|>=|<|>)\s*([-+0-9.eE]+)\s*$")
+
+
+def output_name(text):
+    # a slider, a machine name ("crop_yield") or a calculate_dependent_variables
+    # label ("Crop Yield")
+    if text in OUTPUTS or text in INPUTS:
+        return text
+    if text.lower() in LABELS:
+        return LABELS[text.lower()]
+    raise ValueError(f"unknown output {text!r}")
+
+
+def parse_constraint(text):
+    # "Hunger<=1" -> ("hunger", -1, 1.0); the sign turns >= into <= of the negation
+    match = CONSTRAINT.match(text)
+    if not match:
+        raise ValueError(f"expected OUTPUT<=VALUE or OUTPUT>=VALUE, got {text!r}")
+    name, operator, bound = match.groups()
+    return output_name(name), (1 if operator.startswith("<") else -1), float(bound)
+
+
+class Problem:
+    # objectives: [(output, +1 to maximise / -1 to minimise)]
+    # constraints: [(output, +1 for <= / -1 for >=, bound)]
+    # bounds: input -> (low, high); equal ends hold a slider fixed
+    def __init__(self, objectives, constraints=(), bounds=None):
+        if not objectives:
+            raise ValueError("at least one objective is needed")
+        self.objectives = [(output_name(name), sign) for name, sign in objectives]
+        self.constraints = [(output_name(name), sign, bound) for name, sign, bound in constraints]
+        bounds = {**{name: SLIDER_RANGE for name in INPUTS}, **(bounds or {})}
+        self.low = np.array([bounds[name][0] for name in INPUTS], dtype=np.float64)
+        self.high = np.array([bounds[name][1] for name in INPUTS], dtype=np.float64)
+        spans = {**dict(zip(OUTPUTS, (high - low for low, high in output_ranges()))),
+                 **{name: SLIDER_RANGE[1] - SLIDER_RANGE[0] for name in INPUTS}}
+        self.scales = [spans[name] for name, _, _ in self.constraints]
+        self.model = compiler.compile_numpy()
+        self.evaluations = 0
+
+    def evaluate(self, points):
+        # points: (n, inputs) -> (outputs, scores, violation); scores are the
+        # objectives oriented so that larger is better, violation is the
+        # summed constraint excess as a fraction of each output's range
+        outputs = {**self.model(*points.T), **dict(zip(INPUTS, points.T))}
+        self.evaluations += len(points)
+        scores = np.stack([sign * outputs[name] for name, sign in self.objectives], axis=1)
+        violation = np.zeros(len(points))
+        for (name, sign, bound), scale in zip(self.constraints, self.scales):
+            violation += np.maximum(sign * (outputs[name] - bound), 0) / scale
+        return outputs, scores, violation
+
+    def clip(self, points):
+        return np.clip(points, self.low, self.high, out=points)
+
+
+def _at_least(first, second):
+    # [i, j]: first[i] is at least as good as second[j] on every objective
+    result = first[:, None, 0] >= second[None, :, 0]
+    for column in range(1, first.shape[1]):
+        result &= first[:, None, column] >= second[None, :, column]
+    return result
+
+
+def _covered(front_scores, scores):
+    # for each row of scores: dominated by or equal to some front row
+    if len(front_scores) == 0:
+        return np.zeros(len(scores), dtype=bool)
+    return _at_least(front_scores, scores).any(axis=0)
+
+
+def pareto_front(scores, violation, block=256):
+    # Indices of the non-dominated feasible points, one per distinct outcome.
+    # When nothing is feasible the least-violating points stand in, so the
+    # search can walk towards the feasible region.
+    candidates = np.flatnonzero(violation <= 0)
+    if len(candidates) == 0:
+        candidates = np.flatnonzero(violation <= violation.min() * (1 + 1e-9))
+    # Best first on the first objective, ties broken by the next ones: a point
+    # can then only be dominated by one before it, and whatever the front
+    # does not cover is not covered by anything else before it either. Each
+    # block is screened against the front and its own earlier points at once.
+    order = candidates[np.lexsort((-scores[candidates]).T[::-1])]
+    if scores.shape[1] <= 2:
+        # covered exactly when an earlier point is at least as good on the last objective
+        last = scores[order, -1]
+        best_before = np.concatenate([[-np.inf], np.maximum.accumulate(last)[:-1]])
+        return order[last > best_before]
+    front = [np.empty(0, dtype=np.int64)]
+    front_scores = np.empty((0, scores.shape[1]))
+    for begin in range(0, len(order), block):
+        chunk = order[begin:begin + block]
+        chunk_scores = scores[chunk]
+        earlier = _at_least(chunk_scores, chunk_scores)
+        earlier &= np.tri(len(chunk), k=-1, dtype=bool).T
+        survivors = ~(_covered(front_scores, chunk_scores) | earlier.any(axis=0))
+        front.append(chunk[survivors])
+        front_scores = np.concatenate([front_scores, chunk_scores[survivors]])
+    return np.concatenate(front)
+
+
+def crowding_distance(scores):
+    # NSGA-II spacing along the front: extremes get inf so they are always kept
+    count, objectives = scores.shape
+    distance = np.zeros(count)
+    if count <= 2:
+        return np.full(count, np.inf)
+    for column in range(objectives):
+        order = np.argsort(scores[:, column])
+        values = scores[order, column]
+        span = values[-1] - values[0]
+        distance[order[[0, -1]]] = np.inf
+        if span > 0:
+            distance[order[1:-1]] += (values[2:] - values[:-2]) / span
+    return distance
+
+
+def thin(front, scores, limit):
+    if len(front) <= limit:
+        return front
+    keep = np.argsort(-crowding_distance(scores[front]), kind="stable")[:limit]
+    return front[np.sort(keep)]
+
+
+def coarse_points(problem, divisions, random_points, rng):
+    axes = [np.linspace(low, high, divisions) if high > low else np.array([low])
+            for low, high in zip(problem.low, problem.high)]
+    grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(INPUTS))
+    sampled = problem.low + (problem.high - problem.low) * rng.random((random_points, len(INPUTS)))
+    return np.concatenate([grid, sampled])
+
+
+def mutate(parents, problem, children, step, rng):
+    # Gaussian steps around each parent; half of them move a single slider,
+    # which reaches optima sitting on the box edge or a clamp kink
+    points = np.repeat(parents, children, axis=0)
+    noise = rng.normal(0, step, points.shape) * (problem.high - problem.low)
+    single = rng.random(len(points)) < 0.5
+    keep = rng.integers(len(INPUTS), size=len(points))
+    mask = np.ones_like(noise, dtype=bool)
+    mask[single] = False
+    mask[np.flatnonzero(single), keep[single]] = True
+    points += noise * mask
+    return problem.clip(points)
+
+
+def solve(problem, rounds=20, divisions=11, random_points=20000, children=64, front_size=64, seed=0):
+    # Returns (points, outputs, scores, violation) of the final front, best
+    # first on the first objective; outputs maps each output to its values
+    rng = np.random.default_rng(seed)
+    points = coarse_points(problem, divisions, random_points, rng)
+    outputs, scores, violation = problem.evaluate(points)
+    # With three or more objectives most coarse points can be on the front, so
+    # each slice only contributes the thinned front of its own points
+    seeds = np.concatenate([begin + thin(pareto_front(scores[begin:begin + 4096], violation[begin:begin + 4096]),
+                                         scores[begin:begin + 4096], front_size)
+                            for begin in range(0, len(points), 4096)])
+    front = seeds[thin(pareto_front(scores[seeds], violation[seeds]), scores[seeds], front_size)]
+    points, scores, violation = points[front], scores[front], violation[front]
+
+    for round_index in range(rounds):
+        step = 0.2 * 0.7 ** round_index  # coarse to fine
+        new_points = mutate(points, problem, children, step, rng)
+        _, new_scores, new_violation = problem.evaluate(new_points)
+        points = np.concatenate([points, new_points])
+        scores = np.concatenate([scores, new_scores])
+        violation = np.concatenate([violation, new_violation])
+        front = thin(pareto_front(scores, violation), scores, front_size)
+        points, scores, violation = points[front], scores[front], violation[front]
+
+    outputs, scores, violation = problem.evaluate(points)
+    return points, outputs, scores, violation
+
+
+def settings(points):
+    return [dict(zip(INPUTS, point.tolist())) for point in points]
+
+
+def apply(setting, variables):
+    # pushes a solution into a slider dict such as main.variables
+    variables.update({name: setting[name] for name in INPUTS})
+    return variables
+
+
+def save_setting(setting, path=SAVE_FILE):
+    # saves the solution as main.py's current snapshot (and into its
+    # history), so the app starts from it
+    store = SnapshotStore(path)
+    variables = apply(setting, store.load())
+    store.save(variables)
+    return variables
+
+
+def parse_fix(text):
+    name, _, value = text.partition("=")
+    if name not in INPUTS:
+        raise argparse.ArgumentTypeError(f"unknown variable {name!r}")
+    if ":" in value:
+        low, high = (float(part) for part in value.split(":"))
+    else:
+        low = high = float(value)
+    return name, (low, high)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search slider settings for target outputs.")
+    parser.add_argument("--maximize", action="append", default=[], metavar="OUTPUT", help="output to maximise")
+    parser.add_argument("--minimize", action="append", default=[], metavar="OUTPUT", help="output to minimise")
+    parser.add_argument("--constraint", action="append", default=[], metavar="OUTPUT<=VALUE",
+                        help="bound on an output, e.g. \"Hunger<=1\" or \"water_resources>=100\"")
+    parser.add_argument("--fix", type=parse_fix, action="append", default=[], metavar="NAME=VALUE|LOW:HIGH",
+                        help="hold a slider at a value or inside a range")
+    parser.add_argument("--rounds", type=int, default=20, help="refinement rounds")
+    parser.add_argument("--front-size", type=int, default=64, help="most settings kept on the Pareto front")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--show", type=int, default=10, help="settings to print")
+    parser.add_argument("--apply", type=int, metavar="INDEX",
+                        help=f"write the INDEX-th setting into {SAVE_FILE} for main.py")
+    args = parser.parse_args(argv)
+
+    try:
+        objectives = [(name, 1) for name in args.maximize] + [(name, -1) for name in args.minimize]
+        problem = Problem(objectives, [parse_constraint(text) for text in args.constraint], dict(args.fix))
+    except ValueError as error:
+        parser.error(str(error))
+
+    start = time.perf_counter()
+    points, outputs, _, violation = solve(problem, args.rounds, front_size=args.front_size, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    feasible = bool((violation <= 0).all())
+    print(f"{len(points)} Pareto-optimal setting(s) from {problem.evaluations:,} evaluations in {elapsed:.2f}s"
+          + ("" if feasible else " - no setting meets the constraints, showing the closest"))
+
+    shown = []
+    for name in [name for name, _ in problem.objectives] + [name for name, _, _ in problem.constraints]:
+        if name not in INPUTS and name not in shown:
+            shown.append(name)
+    print(f"{'#':>3}" + "".join(f"{name:>17}" for name in INPUTS + shown))
+    for index in range(min(args.show, len(points))):
+        row = list(points[index]) + [outputs[name][index] for name in shown]
+        print(f"{index:>3}" + "".join(f"{value:17.6g}" for value in row))
+
+    if args.apply is not None:
+        setting = settings(points)[args.apply]
+        save_setting(setting)
+        print(f"setting {args.apply} written to {SAVE_FILE}: {setting}")
+
+
+if __name__ == "__main__":
+    main()
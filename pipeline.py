@@ -0,0 +1,105 @@
+import threading
+import time
+
+# Producer/consumer hand-off between the render loop and a worker thread. The
+# render thread submits slider snapshots; the worker runs `prepare` on the
+# newest one (snapshots that arrive while it is busy replace each other) and
+# publishes the result through a DoubleBuffer, so a frame only ever reads the
+# last completed result and never waits for one.
+
+
+class DoubleBuffer:
+    # `front` is the last completed result and is what readers see; the worker
+    # fills `back` and swaps the two when it is done
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.front = None
+        self.back = None
+        self.version = 0
+
+    def publish(self, value):
+        with self._lock:
+            self.back = value
+            self.front, self.back = self.back, self.front
+            self.version += 1
+
+    def read(self):
+        with self._lock:
+            return self.version, self.front
+
+
+class Pipeline:
+    def __init__(self, prepare, name="prepare"):
+        self.prepare = prepare
+        self.buffers = DoubleBuffer()
+        self.submitted = 0
+        self.completed = 0
+        self.skipped = 0  # snapshots replaced before the worker got to them
+        self.last_seconds = 0.0
+        self.error = None
+        self._pending = None
+        self._wanted = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot):
+        with self._wanted:
+            if self._pending is not None:
+                self.skipped += 1
+            self._pending = snapshot
+            self.submitted += 1
+            self._wanted.notify_all()
+
+    def _run(self):
+        while True:
+            with self._wanted:
+                while self._pending is None and not self._closed:
+                    self._wanted.wait()
+                if self._closed:
+                    return
+                snapshot, self._pending = self._pending, None
+            start = time.perf_counter()
+            try:
+                result = self.prepare(snapshot)
+            except Exception as error:
+                with self._wanted:
+                    self.error = error
+                    self._closed = True
+                    self._wanted.notify_all()
+                return
+            self.last_seconds = time.perf_counter() - start
+            self.buffers.publish((snapshot, result))
+            with self._wanted:
+                self.completed += 1
+                self._wanted.notify_all()
+
+    def latest(self):
+        # (snapshot, result) of the newest completed job, or None before the first one
+        if self.error is not None:
+            raise RuntimeError("the pipeline worker failed") from self.error
+        return self.buffers.read()[1]
+
+    def wait(self, timeout=None):
+        # blocks until everything submitted so far is published; False on timeout
+        with self._wanted:
+            done = self._wanted.wait_for(
+                lambda: self._closed or (self._pending is None and self.completed + self.skipped >= self.submitted),
+                timeout)
+        if self.error is not None:
+            raise RuntimeError("the pipeline worker failed") from self.error
+        return done
+
+    def close(self):
+        with self._wanted:
+            self._closed = True
+            self._wanted.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "last_seconds": self.last_seconds,
+        }
@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from opensimplex import OpenSimplex
+
+import equations
+import terrain
+from clouds import CLOUD_SCALE, CLOUD_STEP, CLOUD_THRESHOLD, PUFF_RADIUS, cloud_opacity
+from layers import glow_params, glow_rings, shading_darkness
+from state import PlanetState, StateModel
+
+# Offline poster renderer: one planet state at any resolution. The scene is the
+# window's planet (radius 200 around (600, 300), glow, terrain, shading and
+# clouds) in window units, scaled to the poster. The image is cut into square
+# tiles rendered in a process pool with NumPy and written to a PNG one band of
+# tiles at a time, so memory stays flat however large the poster is.
+#
+#   python poster.py --size 8192 --state '{"solar_intensity": 40, "humidity": 60}' --out planet.png
+
+DEFAULT_STATE = equations.DEFAULT_VARIABLES
+CENTER = (600, 300)
+RADIUS = 200
+MARGIN = 50  # window units around the planet; the glow reaches RADIUS + 30
+
+_simplex = None
+
+
+def _start_worker(seed):
+    global _simplex
+    _simplex = OpenSimplex(seed=seed)
+
+
+def load_state(text):
+    # a JSON object, or the path of a file holding one
+    if os.path.exists(text):
+        with open(text) as file:
+            text = file.read()
+    return {**DEFAULT_STATE, **json.loads(text)}
+
+
+_model = None
+
+
+def scene(state, cloud_offset=0.0):
+    # everything a tile needs besides its position, in the form main.py draws
+    # it; the compiled model, like the app, so humidity 0 gives Albedo 0
+    # instead of the scalar equations' division by zero
+    global _model
+    if _model is None:
+        _model = StateModel()
+    planet = _model.evaluate(PlanetState(state))
+    return planet_scene(planet.dependent_variables(), state["solar_intensity"], cloud_offset)
+
+
+def planet_scene(dependent_variables, solar_intensity, cloud_offset=0.0):
+    plants_density = max(0, min(100, dependent_variables["Plants Density"]))
+    color, max_glow_alpha, layer_spacing = glow_params(dependent_variables["ASI"])
+    return {
+        "bands": terrain.band_colors(dependent_variables["Rainfall Area"], plants_density),
+        "glow": [(ring, color, alpha) for ring, alpha in glow_rings(RADIUS, max_glow_alpha, layer_spacing)],
+        "darkness": shading_darkness(solar_intensity),
+        "cloud_alpha": cloud_opacity(int(dependent_variables["Cloud Density"])),
+        "cloud_offset": cloud_offset,
+    }
+
+
+def interpolated_noise(simplex, xs, ys, step):
+    # get_noise_value over the grid, sampled every `step` window units on a
+    # lattice shared by all tiles and interpolated bilinearly in between
+    fx, fy = xs / step, ys / step
+    ix0, iy0 = int(np.floor(fx.min())), int(np.floor(fy.min()))
+    lattice = terrain.noise_field(simplex, step * np.arange(ix0, int(np.floor(fx.max())) + 2),
+                                  step * np.arange(iy0, int(np.floor(fy.max())) + 2))
+    gx, gy = np.floor(fx).astype(int) - ix0, np.floor(fy).astype(int) - iy0
+    tx, ty = (fx - np.floor(fx))[None, :], (fy - np.floor(fy))[:, None]
+    top = lattice[gy][:, gx] * (1 - tx) + lattice[gy][:, gx + 1] * tx
+    bottom = lattice[gy + 1][:, gx] * (1 - tx) + lattice[gy + 1][:, gx + 1] * tx
+    return top * (1 - ty) + bottom * ty
+
+
+def cloud_coverage(simplex, xs, ys, offset):
+    # the window's cloud puffs: a PUFF_RADIUS circle on every CLOUD_STEP cell
+    # inside the disk whose noise is above CLOUD_THRESHOLD
+    x0, y0 = int(CENTER[0] - RADIUS), int(CENTER[1] - RADIUS)
+    columns = len(range(x0, int(CENTER[0] + RADIUS), CLOUD_STEP))
+    rows = len(range(y0, int(CENTER[1] + RADIUS), CLOUD_STEP))
+    u, v = np.floor((xs - x0) / CLOUD_STEP).astype(int), np.floor((ys - y0) / CLOUD_STEP).astype(int)
+    first_i, last_i = max(0, u.min() - 1), min(columns - 1, u.max() + 1)
+    first_j, last_j = max(0, v.min() - 1), min(rows - 1, v.max() + 1)
+    covered = np.zeros((len(ys), len(xs)), dtype=bool)
+    if first_i > last_i or first_j > last_j:
+        return covered
+
+    cell_x = x0 + CLOUD_STEP * np.arange(first_i, last_i + 1)
+    cell_y = y0 + CLOUD_STEP * np.arange(first_j, last_j + 1)
+    cloudy = simplex.noise2array((cell_x + offset) / CLOUD_SCALE, (cell_y + offset) / CLOUD_SCALE) > CLOUD_THRESHOLD
+    cloudy &= (cell_x[None, :] - CENTER[0]) ** 2 + (cell_y[:, None] - CENTER[1]) ** 2 <= RADIUS ** 2
+    for dj in (-1, 0, 1):
+        j = v + dj
+        valid_j = (j >= first_j) & (j <= last_j)
+        dy = ys - (y0 + CLOUD_STEP * j)
+        for di in (-1, 0, 1):
+            i = u + di
+            valid_i = (i >= first_i) & (i <= last_i)
+            dx = xs - (x0 + CLOUD_STEP * i)
+            near = (dx[None, :] ** 2 + dy[:, None] ** 2 <= PUFF_RADIUS ** 2) & valid_j[:, None] & valid_i[None, :]
+            rows_index = np.clip(j - first_j, 0, last_j - first_j)
+            columns_index = np.clip(i - first_i, 0, last_i - first_i)
+            covered |= near & cloudy[rows_index][:, columns_index]
+    return covered
+
+
+def _blend(image, mask, color, alpha):
+    image[mask] = image[mask] * (1 - alpha / 255) + np.asarray(color, dtype=np.float32) * (alpha / 255)
+
+
+def paint(scene, distance, bands, covered):
+    # The pixels of one scene. distance is the squared distance of every pixel
+    # from CENTER in window units, bands its terrain band and covered its cloud
+    # mask (None where there is no disk or no cloud). Returns (h, w, 3) uint8.
+    image = np.zeros(distance.shape + (3,), dtype=np.float32)
+
+    # glow rings from the innermost out, each a filled disk drawn over the last
+    for ring, color, alpha in scene["glow"]:
+        _blend(image, distance <= ring ** 2, color, alpha)
+
+    inside = distance <= RADIUS ** 2
+    if bands is not None:
+        image[inside] = np.asarray(scene["bands"], dtype=np.float32)[bands[inside]]
+        _blend(image, inside, (0, 0, 0), scene["darkness"])
+
+    if covered is not None:
+        _blend(image, covered, (255, 255, 255), scene["cloud_alpha"])
+    return np.clip(np.rint(image), 0, 255).astype(np.uint8)
+
+
+def render_tile(tile, size, scene, noise_step):
+    left, top, width, height = tile
+    scale = size / (2 * (RADIUS + MARGIN))
+    xs = CENTER[0] - RADIUS - MARGIN + (left + np.arange(width) + 0.5) / scale
+    ys = CENTER[1] - RADIUS - MARGIN + (top + np.arange(height) + 0.5) / scale
+    distance = (xs[None, :] - CENTER[0]) ** 2 + (ys[:, None] - CENTER[1]) ** 2
+    bands = covered = None
+    if distance.min() <= RADIUS ** 2:
+        bands = terrain.terrain_bands(interpolated_noise(_simplex, xs, ys, noise_step))
+    if distance.min() <= (RADIUS + 2 * PUFF_RADIUS) ** 2:
+        covered = cloud_coverage(_simplex, xs, ys, scene["cloud_offset"])
+    return tile, paint(scene, distance, bands, covered)
+
+
+class PNGWriter:
+    # writes an RGB PNG from rows of pixels as they arrive
+    def __init__(self, path, width, height, level=6):
+        self.file = open(path, "wb")
+        self.width = width
+        self.compressor = zlib.compressobj(level)
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def write_rows(self, rows):
+        # rows: (count, width, 3) uint8; every scanline starts with filter type 0
+        scanlines = np.zeros((rows.shape[0], 1 + 3 * self.width), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self):
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+        self.file.close()
+
+
+def tiles(size, tile_size):
+    # row by row, so each band of tiles can be written as soon as it is done
+    for top in range(0, size, tile_size):
+        yield [(left, top, min(tile_size, size - left), min(tile_size, size - top))
+               for left in range(0, size, tile_size)]
+
+
+def render_poster(state, out_path, size=8192, tile_size=512, workers=None, noise_step=1.0, cloud_offset=0.0,
+                  seed=42, progress=True):
+    workers = workers or os.cpu_count() or 1
+    planet = scene(state, cloud_offset)
+    writer = PNGWriter(out_path, size, size)
+    bands = list(tiles(size, tile_size))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=(seed,)) as pool:
+        # at most two bands of tiles are queued or waiting to be written
+        queued = [[pool.submit(render_tile, tile, size, planet, noise_step) for tile in band] for band in bands[:2]]
+        for index in range(len(bands)):
+            futures = queued.pop(0)
+            if index + 2 < len(bands):
+                queued.append([pool.submit(render_tile, tile, size, planet, noise_step) for tile in bands[index + 2]])
+            results = [future.result() for future in futures]
+            height = results[0][0][3]
+            writer.write_rows(np.concatenate([pixels for _, pixels in results], axis=1).reshape(height, size, 3))
+            if progress:
+                print(f"band {index + 1}/{len(bands)} after {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    writer.close()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a planet state as a high-resolution PNG poster.")
+    parser.add_argument("--state", default="{}", help="slider state as JSON or a JSON file (missing sliders use the defaults)")
+    parser.add_argument("--size", type=int, default=8192, help="width and height in pixels (default 8192)")
+    parser.add_argument("--tile", type=int, default=512, help="tile size in pixels")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: all cores)")
+    parser.add_argument("--noise-step", type=float, default=1.0,
+                        help="terrain noise lattice spacing in window pixels (default 1)")
+    parser.add_argument("--cloud-offset", type=float, default=0.0, help="wind offset of the clouds")
+    parser.add_argument("--seed", type=int, default=42, help="noise seed (main.py uses 42)")
+    parser.add_argument("--out", default="poster.png", help="output PNG")
+    args = parser.parse_args(argv)
+
+    state = load_state(args.state)
+    elapsed = render_poster(state, args.out, args.size, args.tile, args.workers, args.noise_step,
+                            args.cloud_offset, args.seed)
+    print(f"{args.size}x{args.size} poster in {elapsed:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
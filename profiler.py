@@ -0,0 +1,164 @@
+import csv
+import json
+from collections import deque
+from contextlib import nullcontext
+from time import perf_counter_ns
+
+import pygame
+
+# Per-stage frame timings. Code wraps each stage in `with profiler.stage(name):`
+# and the frame loop brackets every frame with begin_frame()/end_frame(); time
+# spent in a stage several times per frame (clipped repaints) adds up. The last
+# `window` frames give the rolling percentiles for the overlay, and every frame
+# can be appended to a .csv or .jsonl file. A disabled profiler hands out one
+# shared null context, so instrumented code costs next to nothing.
+
+PERCENTILES = (50, 95, 99)
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("current", "name", "start")
+
+    def __init__(self, current, name):
+        self.current = current
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+
+    def __exit__(self, *exc_info):
+        elapsed = perf_counter_ns() - self.start
+        self.current[self.name] = self.current.get(self.name, 0) + elapsed
+
+
+def percentile(sorted_values, q):
+    # nearest-rank percentile of an already sorted sequence
+    if not sorted_values:
+        return 0
+    index = max(0, min(len(sorted_values) - 1, -(-q * len(sorted_values) // 100) - 1))
+    return sorted_values[index]
+
+
+class FrameProfiler:
+    def __init__(self, stages, window=300, enabled=False):
+        self.stages = list(stages)
+        self.window = window
+        self.enabled = enabled
+        self.current = {}
+        self._stages = {}
+        self.samples = {name: deque(maxlen=window) for name in self.stages + ["frame"]}
+        self.frames = 0
+        self._frame_start = None
+        self._export = None
+        self._writer = None
+        self.overlay_visible = False
+        self.overlay_refresh = 15  # frames between overlay text updates
+        self._overlay = None  # (frame it was made on, surface)
+        self.overlay_version = 0
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(self.current, name)
+        return stage
+
+    def begin_frame(self):
+        if self.enabled:
+            self.current.clear()
+            self._frame_start = perf_counter_ns()
+
+    def end_frame(self):
+        if not self.enabled or self._frame_start is None:
+            return
+        total = perf_counter_ns() - self._frame_start
+        self._frame_start = None
+        self.frames += 1
+        self.samples["frame"].append(total)
+        for name in self.stages:
+            self.samples[name].append(self.current.get(name, 0))
+        if self._writer is not None:
+            self._write(total)
+
+    def toggle_overlay(self):
+        # profiling runs while the overlay is shown or an export is open
+        self.overlay_visible = not self.overlay_visible
+        self.enabled = self.overlay_visible or self._export is not None
+        self._overlay = None
+
+    def percentiles(self, name):
+        # (p50, p95, p99) in milliseconds over the rolling window
+        values = sorted(self.samples[name])
+        return tuple(percentile(values, q) / 1e6 for q in PERCENTILES)
+
+    def report(self):
+        return {name: self.percentiles(name) for name in self.stages + ["frame"]}
+
+    def overlay_rows(self):
+        rows = [["stage (ms)"] + [f"p{q}" for q in PERCENTILES]]
+        for name, values in self.report().items():
+            rows.append([name] + [f"{value:.2f}" for value in values])
+        return rows
+
+    def overlay_lines(self):
+        return [f"{row[0]:<20}" + "".join(f"{cell:>8}" for cell in row[1:]) for row in self.overlay_rows()]
+
+    def overlay_size(self):
+        if not self.overlay_visible or self._overlay is None:
+            return (0, 0)
+        return self._overlay[1].get_size()
+
+    def update_overlay(self, font):
+        # rebuilds the overlay surface every overlay_refresh frames and
+        # returns whether it changed
+        if not self.overlay_visible:
+            return False
+        if self._overlay is not None and self.frames - self._overlay[0] < self.overlay_refresh:
+            return False
+        # stage names left aligned, the percentile columns right aligned (ms)
+        cells = [[font.render(cell, True, (255, 255, 255)) for cell in row] for row in self.overlay_rows()]
+        widths = [max(row[column].get_width() for row in cells) for column in range(len(cells[0]))]
+        line_height = font.get_linesize()
+        surface = pygame.Surface((sum(widths) + 16 * (len(widths) - 1) + 12, line_height * len(cells) + 12),
+                                 pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 220))
+        for line, row in enumerate(cells):
+            x = 6
+            for column, cell in enumerate(row):
+                offset = 0 if column == 0 else widths[column] - cell.get_width()
+                surface.blit(cell, (x + offset, 6 + line * line_height))
+                x += widths[column] + 16
+        self._overlay = (self.frames, surface)
+        self.overlay_version += 1
+        return True
+
+    def draw_overlay(self, target, position):
+        if self.overlay_visible and self._overlay is not None:
+            target.blit(self._overlay[1], position)
+
+    def open_export(self, path):
+        # one row per frame, stage times in nanoseconds; .jsonl writes JSON lines, anything else CSV
+        self.close_export()
+        self.enabled = True
+        self._export = open(path, "w", newline="")
+        if path.endswith(".jsonl"):
+            self._writer = "jsonl"
+        else:
+            self._writer = csv.writer(self._export)
+            self._writer.writerow(["frame", "frame_ns"] + [f"{name}_ns" for name in self.stages])
+
+    def _write(self, total):
+        times = [self.current.get(name, 0) for name in self.stages]
+        if self._writer == "jsonl":
+            record = {"frame": self.frames, "frame_ns": total, "stages_ns": dict(zip(self.stages, times))}
+            self._export.write(json.dumps(record) + "\n")
+        else:
+            self._writer.writerow([self.frames, total] + times)
+
+    def close_export(self):
+        if self._export is not None:
+            self._export.close()
+        self._export = None
+        self._writer = None
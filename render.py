@@ -0,0 +1,111 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+
+# Headless renderer: plays a scripted list of slider states through
+# main.draw_frame on an offscreen surface and writes an image sequence.
+# PNG encoding happens in a worker pool so the render loop never waits on disk.
+#
+#   python render.py states.json --out frames --workers 4
+#
+# states.json is a list of slider states, each optionally held for several
+# frames so clouds and stars keep moving:
+#   [{"solar_intensity": 30, "humidity": 60, "wind_speed": 10, "population": 5, "frames": 30}, ...]
+
+
+def load_script(path):
+    with open(path) as file:
+        text = file.read()
+    try:
+        states = json.loads(text)
+    except json.JSONDecodeError:
+        # also accept one JSON object per line
+        states = [json.loads(line) for line in text.splitlines() if line.strip()]
+    frames = []
+    for state in states:
+        state = dict(state)
+        count = int(state.pop("frames", 1))
+        frames.extend([state] * count)
+    return frames
+
+
+def encode_frame(path, data, size):
+    import pygame
+    surface = pygame.image.frombytes(data, size, "RGB")
+    pygame.image.save(surface, path)
+    return path
+
+
+def render(frames, out_dir, workers=None, image_format="png", seed=0, max_pending=None, profile=None):
+    start = time.perf_counter()
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    random.seed(seed)  # the star field is drawn from `random` at import
+    import pygame
+    import main
+
+    surface = pygame.Surface((main.SCREEN_WIDTH, main.screenheight))
+    main.screen = surface
+    if profile:
+        main.profiler.open_export(profile)
+    os.makedirs(out_dir, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * workers
+    size = surface.get_size()
+    no_mouse = (-1, -1)
+
+    render_time = 0.0
+    first_frame = None
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        pending = []
+        for index, state in enumerate(frames):
+            frame_start = time.perf_counter()
+            main.profiler.begin_frame()
+            main.variables.update(state)
+            main.draw_frame(no_mouse)
+            with main.profiler.stage("present"):
+                data = pygame.image.tobytes(surface, "RGB")
+            main.profiler.end_frame()
+            render_time += time.perf_counter() - frame_start
+            if first_frame is None:
+                first_frame = time.perf_counter() - start
+
+            path = os.path.join(out_dir, f"frame_{index:05d}.{image_format}")
+            pending.append(pool.apply_async(encode_frame, (path, data, size)))
+            # keep a bounded number of raw frames queued for the encoders
+            while len(pending) > max_pending:
+                pending.pop(0).get()
+        for result in pending:
+            result.get()
+    main.profiler.close_export()
+    elapsed = time.perf_counter() - start
+    return len(frames), render_time, elapsed, first_frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render scripted slider states to an image sequence without a display.")
+    parser.add_argument("script", help="JSON list (or JSON lines) of slider states")
+    parser.add_argument("--out", default="frames", help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="encoder processes (default: all cores)")
+    parser.add_argument("--format", default="png", choices=["png", "bmp", "tga", "jpg"], help="image format")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the star field")
+    parser.add_argument("--profile", help="write per-frame stage times to this .csv or .jsonl file")
+    args = parser.parse_args(argv)
+
+    frames = load_script(args.script)
+    count, render_time, elapsed, first_frame = render(frames, args.out, args.workers, args.format, args.seed,
+                                                      profile=args.profile)
+    print(f"first frame after {first_frame:.2f}s (including startup)")
+    print(f"{count} frames in {elapsed:.2f}s: {count / elapsed:.1f} fps written, "
+          f"{count / render_time:.1f} fps rendered")
+    if args.profile:
+        from main import profiler
+        for line in profiler.overlay_lines():
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Records a session of main.py and plays it back.
+#
+# A run of main.py is reproducible from three things: the seed of `random`
+# (the stars are placed at import and twinkle every frame), the sliders it
+# started from, and for every frame the pygame events and the mouse position
+# the loop saw. `record` runs the app normally and writes those to a JSON
+# lines file: a header line, then one line per frame. `play` imports main.py
+# with the same seed and sliders and feeds the frames back through
+# main.run_frame, either at the recorded pace (--realtime) or as fast as it
+# can, and reports per-frame times; --export writes every frame's stage times
+# as the F3 profiler does.
+#
+# Playback is headless unless --window is given. Saves and autosaves made
+# during playback go to a scratch directory, never to the real save files.
+# With the background pipeline on, which prepared result a frame shows
+# depends on thread timing; --sync evaluates in the frame so that a replay
+# draws exactly the recorded pixels (checked with --check when the recording
+# was made with --hashes).
+#
+#   python replay.py record session.jsonl
+#   python replay.py play session.jsonl --export frames.csv
+#   python replay.py play session.jsonl --realtime --window
+
+RECORDING_VERSION = 1
+
+
+def _plain(value):
+    # event attributes as JSON values; anything else (window handles) is dropped
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    if isinstance(value, (tuple, list)) and all(isinstance(item, (bool, int, float)) for item in value):
+        return list(value)
+    raise TypeError
+
+
+def encode_event(event):
+    attributes = {}
+    for name, value in event.dict.items():
+        try:
+            attributes[name] = _plain(value)
+        except TypeError:
+            pass
+    return [event.type, attributes]
+
+
+def decode_event(pygame, encoded):
+    event_type, attributes = encoded
+    # positions and similar come back as the tuples pygame hands out
+    return pygame.event.Event(event_type, {name: tuple(value) if isinstance(value, list) else value
+                                           for name, value in attributes.items()})
+
+
+def screen_hash(pygame, surface):
+    return hashlib.md5(pygame.image.tobytes(surface, "RGB")).hexdigest()
+
+
+def load_app(seed, sync=False, headless=False, save_dir=None):
+    # imports main.py with `random` seeded the way the recording had it, and
+    # its save files in save_dir if given; only the first import in a process
+    # builds the stars and opens the save files
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    if save_dir is not None:
+        os.environ["PLANET_SAVE_DIR"] = save_dir
+    random.seed(seed)
+    import main
+    if sync:
+        main.PREPARE_IN_BACKGROUND = False
+    return main
+
+
+def read_recording(path):
+    with open(path) as file:
+        header = json.loads(file.readline())
+        if header.get("version") != RECORDING_VERSION:
+            raise ValueError(f"{path} is recording version {header.get('version')}, expected {RECORDING_VERSION}")
+        frames = [json.loads(line) for line in file if line.strip()]
+    return header, frames
+
+
+def record(path, seed=None, sync=False, hashes=False, frames=None):
+    # runs the app in its window until it is closed (or for `frames` frames)
+    seed = random.SystemRandom().randrange(2 ** 32) if seed is None else seed
+    main = load_app(seed, sync)
+    import pygame
+    header = {
+        "version": RECORDING_VERSION,
+        "seed": seed,
+        "variables": dict(main.variables),
+        "sync": not main.PREPARE_IN_BACKGROUND,
+        "size": list(main.screen.get_size()),
+        "fps": main.FPS,
+    }
+    count = 0
+    with open(path, "w") as file:
+        file.write(json.dumps(header) + "\n")
+        main.start()
+        begin = time.perf_counter()
+        running = True
+        while running and (frames is None or count < frames):
+            events = pygame.event.get()
+            mouse = pygame.mouse.get_pos()
+            frame = {"t": round(time.perf_counter() - begin, 6), "mouse": list(mouse),
+                     "events": [encode_event(event) for event in events]}
+            running = main.run_frame(events, mouse)
+            if hashes:
+                frame["hash"] = screen_hash(pygame, main.screen)
+            file.write(json.dumps(frame) + "\n")
+            count += 1
+            main.clock.tick(main.FPS)
+        main.stop()
+    pygame.quit()
+    return count
+
+
+def play(path, realtime=False, sync=None, window=False, export=None, check=False):
+    # Returns (frame times in seconds, frames whose pixels differ from the
+    # recorded hashes or None when not checked, the recording's frame cap)
+    header, frames = read_recording(path)
+    sync = header["sync"] if sync is None else sync
+    # main.py opens its save files on import, so they must point at the
+    # scratch directory before it is imported
+    scratch = tempfile.TemporaryDirectory(prefix="replay-")
+    main = load_app(header["seed"], sync, headless=not window, save_dir=scratch.name)
+    import pygame
+
+    main.variables.clear()
+    main.variables.update(header["variables"])
+    main.PROFILE_EXPORT = export
+
+    check = check and all("hash" in frame for frame in frames)
+    mismatches = [] if check else None
+    times = []
+    main.start()
+    begin = time.perf_counter()
+    try:
+        for index, frame in enumerate(frames):
+            if realtime:
+                delay = frame["t"] - (time.perf_counter() - begin)
+                if delay > 0:
+                    time.sleep(delay)
+            pygame.event.get()  # the window's own events are not part of the replay
+            events = [decode_event(pygame, encoded) for encoded in frame["events"]]
+            start = time.perf_counter()
+            running = main.run_frame(events, tuple(frame["mouse"]))
+            times.append(time.perf_counter() - start)
+            if check and screen_hash(pygame, main.screen) != frame["hash"]:
+                mismatches.append(index)
+            if not running:
+                break
+    finally:
+        main.stop()
+        scratch.cleanup()
+        pygame.quit()
+    return times, mismatches, header["fps"]
+
+
+def summarize(times, fps):
+    ordered = sorted(times)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] * 1e3
+    return {
+        "frames": len(times),
+        "total_s": sum(times),
+        "mean_ms": statistics.fmean(times) * 1e3,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1e3,
+        "fps": fps,
+        "over_budget": sum(1 for value in times if value > 1 / fps),  # frames slower than the recorded cap allows
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record a session of main.py and replay it as a benchmark.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    recorder = commands.add_parser("record", help="run the app and record its input")
+    recorder.add_argument("path", help="recording to write (.jsonl)")
+    recorder.add_argument("--seed", type=int, help="seed for `random` (default: a fresh one)")
+    recorder.add_argument("--sync", action="store_true", help="evaluate in the frame instead of the pipeline")
+    recorder.add_argument("--hashes", action="store_true", help="store a hash of every frame for play --check")
+    recorder.add_argument("--frames", type=int, help="stop after this many frames")
+    player = commands.add_parser("play", help="replay a recording and time every frame")
+    player.add_argument("path", help="recording to play")
+    player.add_argument("--realtime", action="store_true", help="keep the recorded pace instead of running flat out")
+    mode = player.add_mutually_exclusive_group()
+    mode.add_argument("--sync", dest="sync", action="store_true", default=None,
+                      help="evaluate in the frame (pixel-exact replay)")
+    mode.add_argument("--pipeline", dest="sync", action="store_false", help="use the background pipeline")
+    player.add_argument("--window", action="store_true", help="show the replay instead of running headless")
+    player.add_argument("--export", metavar="PATH", help="per-frame stage times, .csv or .jsonl")
+    player.add_argument("--check", action="store_true", help="compare every frame with the recorded hashes")
+    player.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        count = record(args.path, args.seed, args.sync, args.hashes, args.frames)
+        print(f"{count} frames recorded to {args.path}")
+        return
+
+    times, mismatches, fps = play(args.path, args.realtime, args.sync, args.window, args.export, args.check)
+    summary = summarize(times, fps)
+    if mismatches is not None:
+        summary["mismatched_frames"] = len(mismatches)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"{summary['frames']} frames in {summary['total_s']:.2f}s: mean {summary['mean_ms']:.2f} ms, "
+              f"p50 {summary['p50_ms']:.2f}, p95 {summary['p95_ms']:.2f}, p99 {summary['p99_ms']:.2f}, "
+              f"max {summary['max_ms']:.2f} ms, {summary['over_budget']} over {1000 / fps:.1f} ms")
+        if mismatches is not None:
+            print(f"{len(mismatches)} frame(s) differ from the recording"
+                  + (f", first at {mismatches[0]}" if mismatches else ""))
+    if args.check and mismatches is None:
+        print("the recording has no frame hashes (record with --hashes)", file=sys.stderr)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import pygame
+
+# Redraws only what changed since the last frame. Each frame the caller reports
+# every layer's state and screen bounds with track(); a layer whose state or
+# bounds changed marks its old and new bounds dirty. flush() repaints just the
+# dirty areas, clipped, and returns them for pygame.display.update.
+
+
+class RedrawScheduler:
+    def __init__(self):
+        self.layers = {}  # name -> (state, bounds) as last painted
+        self.dirty = []
+        self.everything = True
+        self.frames = 0
+        self.full_redraws = 0
+        self.painted_rects = 0
+        self.painted_pixels = 0
+
+    def invalidate(self, rect=None):
+        # repaint `rect` on the next flush, or the whole surface without one
+        if rect is None:
+            self.everything = True
+        else:
+            self.dirty.append(pygame.Rect(rect))
+
+    def track(self, name, state, bounds):
+        previous = self.layers.get(name)
+        if previous == (state, bounds):
+            return
+        if previous is not None:
+            self.dirty.append(previous[1])
+        self.dirty.append(bounds)
+        self.layers[name] = (state, bounds)
+
+    def _merge(self, screen_rect):
+        # overlapping rects are joined so no pixel is painted twice
+        merged = []
+        for rect in self.dirty:
+            rect = rect.clip(screen_rect)
+            if not rect:
+                continue
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect = rect.union(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+    def flush(self, surface, paint):
+        # paint(area) must draw every layer that overlaps `area`
+        self.frames += 1
+        screen_rect = surface.get_rect()
+        if self.everything:
+            self.full_redraws += 1
+            rects = [screen_rect]
+            paint(screen_rect)
+        else:
+            rects = self._merge(screen_rect)
+            for rect in rects:
+                surface.set_clip(rect)
+                paint(rect)
+            surface.set_clip(None)
+        self.everything = False
+        self.dirty = []
+        self.painted_rects = len(rects)
+        self.painted_pixels = sum(rect.width * rect.height for rect in rects)
+        return rects
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "full_redraws": self.full_redraws,
+            "painted_rects": self.painted_rects,
+            "painted_pixels": self.painted_pixels,
+        }
@@ -0,0 +1,315 @@
+import argparse
+import ast
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+import compiler
+import equations
+import montecarlo
+
+# Sensitivity of the outputs to the sliders.
+#
+# jacobian() gives the exact partial derivatives of every output with respect
+# to the four sliders at a batch of operating points. compiler.MODEL is
+# evaluated with forward-mode dual numbers: each value carries its gradient
+# through the arithmetic, cos/sqrt/log, max() and the if/else of crop yield,
+# and a clamp that saturates zeroes the gradient. These are derivatives of the
+# float model; the int() truncation of calculate_dependent_variables is
+# ignored.
+#
+# sobol_indices() estimates first-order and total variance-based indices with
+# the Saltelli/Jansen estimators over the montecarlo.py input distributions.
+#
+#   python sensitivity.py --state '{"solar_intensity": 40, "humidity": 60}'
+#   python sensitivity.py --sobol 200000 --input humidity=normal:60:8
+
+INPUTS = equations.INDEPENDENT_VARIABLES
+OUTPUTS = [name for name, _ in equations.DEPENDENT_VARIABLES]
+SLIDER_SPAN = 100.0
+
+
+class Dual:
+    # value: array of n points, grad: (len(INPUTS), n)
+    __slots__ = ("value", "grad")
+
+    def __init__(self, value, grad):
+        self.value = value
+        self.grad = grad
+
+    def __add__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.value + other.value, self.grad + other.grad)
+        return Dual(self.value + other, self.grad)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.value - other.value, self.grad - other.grad)
+        return Dual(self.value - other, self.grad)
+
+    def __rsub__(self, other):
+        return Dual(other - self.value, -self.grad)
+
+    def __neg__(self):
+        return Dual(-self.value, -self.grad)
+
+    def __mul__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.value * other.value, self.grad * other.value + other.grad * self.value)
+        return Dual(self.value * other, self.grad * other)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.value / other.value,
+                        (self.grad * other.value - other.grad * self.value) / other.value ** 2)
+        return Dual(self.value / other, self.grad / other)
+
+    def __rtruediv__(self, other):
+        return Dual(other / self.value, -other * self.grad / self.value ** 2)
+
+    def __pow__(self, exponent):
+        if isinstance(exponent, Dual):
+            raise TypeError("only constant exponents are supported")
+        return Dual(self.value ** exponent, exponent * self.value ** (exponent - 1) * self.grad)
+
+    # comparisons only pick branches, so they act on the values
+    def __gt__(self, other):
+        return self.value > _value(other)
+
+    def __ge__(self, other):
+        return self.value >= _value(other)
+
+    def __lt__(self, other):
+        return self.value < _value(other)
+
+    def __le__(self, other):
+        return self.value <= _value(other)
+
+
+def _value(x):
+    return x.value if isinstance(x, Dual) else x
+
+
+def _grad(x, like):
+    return x.grad if isinstance(x, Dual) else np.zeros_like(like.grad)
+
+
+def _cos(x):
+    return Dual(np.cos(x.value), -np.sin(x.value) * x.grad)
+
+
+def _sqrt(x):
+    root = np.sqrt(x.value)
+    return Dual(root, x.grad / (2 * root))
+
+
+def _log(x):
+    return Dual(equations._log_like_math(x.value), x.grad / x.value)
+
+
+def _max(a, b):
+    # np.maximum, with the gradient of whichever side is taken
+    dual = a if isinstance(a, Dual) else b
+    first = _value(a) >= _value(b)
+    return Dual(np.where(first, _value(a), _value(b)), np.where(first, _grad(a, dual), _grad(b, dual)))
+
+
+def _where(condition, a, b):
+    dual = a if isinstance(a, Dual) else b
+    return Dual(np.where(condition, _value(a), _value(b)), np.where(condition, _grad(a, dual), _grad(b, dual)))
+
+
+def _clip(x, low, high):
+    # outside the bounds the output is pinned, so nothing moves it
+    if not isinstance(x, Dual):
+        x = Dual(np.asarray(x, dtype=np.float64), np.zeros((len(INPUTS), np.size(x))))
+    saturated = (x.value < low) | (x.value > high)
+    return Dual(np.clip(x.value, low, high), np.where(saturated, 0.0, x.grad))
+
+
+DUAL_NAMESPACE = {"_cos": _cos, "_sqrt": _sqrt, "_log": _log, "_max": _max, "_where": _where, "pi": math.pi}
+
+
+class _ToDual(ast.NodeTransformer):
+    # rewrites a scalar expression so it evaluates on Dual values
+    functions = {"cos": "_cos", "sqrt": "_sqrt", "log": "_log", "max": "_max"}
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in self.functions:
+            node.func = ast.Name(id=self.functions[node.func.id], ctx=ast.Load())
+        return node
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        return ast.Call(func=ast.Name(id="_where", ctx=ast.Load()),
+                        args=[node.test, node.body, node.orelse], keywords=[])
+
+
+def _compile_model(model):
+    steps = []
+    for output, _, expression, low, high in model:
+        tree = ast.fix_missing_locations(_ToDual().visit(ast.parse(expression, mode="eval")))
+        steps.append((output, compile(tree, f"<dual {output}>", "eval"), low, high))
+    return steps
+
+
+_steps = {}
+
+
+def jacobian(solar_intensity, humidity, wind_speed, population, model=compiler.MODEL):
+    # Returns (values, J): values maps each output to its array over the n
+    # points and J[output, input, point] is d output / d input, both in
+    # OUTPUTS / INPUTS order
+    steps = _steps.get(id(model))
+    if steps is None:
+        steps = _steps[id(model)] = _compile_model(model)
+    columns = np.broadcast_arrays(*(np.atleast_1d(np.asarray(column, dtype=np.float64))
+                                    for column in (solar_intensity, humidity, wind_speed, population)))
+    count = columns[0].size
+    namespace = dict(DUAL_NAMESPACE)
+    for index, (name, column) in enumerate(zip(INPUTS, columns)):
+        grad = np.zeros((len(INPUTS), count))
+        grad[index] = 1.0
+        namespace[name] = Dual(column.ravel(), grad)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for output, code, low, high in steps:
+            value = eval(code, namespace)
+            if low is not None or high is not None:
+                value = _clip(value, low, high)
+            namespace[output] = value
+    values = {name: namespace[name].value for name in OUTPUTS}
+    return values, np.stack([namespace[name].grad for name in OUTPUTS])
+
+
+def jacobian_at(state):
+    # one operating point: {output: {input: derivative}}
+    _, matrix = jacobian(*(state[name] for name in INPUTS))
+    return {output: dict(zip(INPUTS, matrix[row, :, 0].tolist())) for row, output in enumerate(OUTPUTS)}
+
+
+def drivers(state, outputs=OUTPUTS):
+    # What moves each output here: the inputs ranked by how much of the
+    # output's local change a full-slider move would cause (|d/dx| * 100),
+    # as (input, derivative, share) with shares summing to 1 (0 when the
+    # output is flat, e.g. clamped)
+    _, matrix = jacobian(*(state[name] for name in INPUTS))
+    result = {}
+    for output in outputs:
+        derivatives = matrix[OUTPUTS.index(output), :, 0]
+        effect = np.abs(derivatives) * SLIDER_SPAN
+        total = effect.sum()
+        shares = effect / total if total > 0 else np.zeros_like(effect)
+        ranked = sorted(zip(INPUTS, derivatives.tolist(), shares.tolist()), key=lambda entry: -entry[2])
+        result[output] = ranked
+    return result
+
+
+def _evaluate(model, columns):
+    outputs = model(*columns)
+    return np.stack([outputs[name] for name in OUTPUTS])
+
+
+def sobol_indices(inputs=None, samples=100_000, seed=0, batch_size=50_000, clip=True):
+    # First-order (Saltelli 2010) and total (Jansen 1999) indices of every
+    # output for every input, each (outputs, inputs); NaN for an output that
+    # does not vary. inputs are montecarlo.py distributions. Costs
+    # samples * (len(INPUTS) + 2) model evaluations, streamed in batches.
+    inputs = inputs or montecarlo.DEFAULT_INPUTS
+    model = compiler.compile_numpy()
+    rng = np.random.default_rng(seed)
+    shape = (len(OUTPUTS), len(INPUTS))
+    first = np.zeros(shape)
+    total = np.zeros(shape)
+    shift = None
+    sums = np.zeros(len(OUTPUTS))
+    squares = np.zeros(len(OUTPUTS))
+    count = 0
+    for begin in range(0, samples, batch_size):
+        size = min(batch_size, samples - begin)
+        a = montecarlo.sample_inputs(inputs, rng, size, clip)
+        b = montecarlo.sample_inputs(inputs, rng, size, clip)
+        fa, fb = _evaluate(model, a), _evaluate(model, b)
+        if shift is None:
+            shift = fa.mean(axis=1, keepdims=True)  # keeps the sums small for large outputs
+        fa -= shift
+        fb -= shift
+        for column in range(len(INPUTS)):
+            mixed = list(a)
+            mixed[column] = b[column]
+            fab = _evaluate(model, mixed) - shift
+            first[:, column] += (fb * (fab - fa)).sum(axis=1)
+            total[:, column] += ((fa - fab) ** 2).sum(axis=1)
+        both = np.concatenate([fa, fb], axis=1)
+        sums += both.sum(axis=1)
+        squares += (both ** 2).sum(axis=1)
+        count += size
+    variance = squares / (2 * count) - (sums / (2 * count)) ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        varies = variance[:, None] > 1e-12 * np.maximum(squares / (2 * count), 1e-300)[:, None]
+        first = np.where(varies, first / count / variance[:, None], np.nan)
+        total = np.where(varies, total / (2 * count) / variance[:, None], np.nan)
+    return first, total
+
+
+def load_state(text):
+    # the means of the default input distributions fill in missing sliders
+    state = {name: parameters[0] for name, (_, parameters) in montecarlo.DEFAULT_INPUTS.items()}
+    state.update(json.loads(text))
+    return state
+
+
+def print_matrix(title, names, matrix, out=sys.stdout):
+    print(title, file=out)
+    print(f"{'output':<22}" + "".join(f"{name:>17}" for name in INPUTS), file=out)
+    for name in names:
+        row = OUTPUTS.index(name)
+        print(f"{name:<22}" + "".join(f"{value:17.6g}" for value in matrix[row]), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local derivatives and global sensitivity indices of the model.")
+    parser.add_argument("--state", default="{}", help="operating point as JSON (missing sliders use the defaults)")
+    parser.add_argument("--outputs", help="comma-separated outputs to print (default: all)")
+    parser.add_argument("--sobol", type=int, metavar="SAMPLES", help="also estimate Sobol indices from this many samples")
+    parser.add_argument("--input", type=montecarlo.parse_input, action="append", default=[], metavar="NAME=DIST:P1:P2",
+                        help="input distribution for --sobol, as in montecarlo.py")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for --sobol")
+    args = parser.parse_args(argv)
+
+    names = OUTPUTS if not args.outputs else args.outputs.split(",")
+    for name in names:
+        if name not in OUTPUTS:
+            parser.error(f"unknown output {name!r}")
+
+    state = load_state(args.state)
+    start = time.perf_counter()
+    _, matrix = jacobian(*(state[name] for name in INPUTS))
+    elapsed = time.perf_counter() - start
+    print_matrix(f"d output / d input at {state} ({elapsed * 1e3:.2f} ms)", names, matrix[:, :, 0])
+    print()
+    for output, ranked in drivers(state, names).items():
+        shares = [f"{name} {share:.0%}" for name, _, share in ranked if share >= 0.005]
+        print(f"{output:<22}{', '.join(shares) or 'flat (saturated or constant)'}")
+
+    if args.sobol:
+        inputs = dict(montecarlo.DEFAULT_INPUTS)
+        inputs.update(args.input)
+        start = time.perf_counter()
+        first, total = sobol_indices(inputs, args.sobol, args.seed)
+        print()
+        print_matrix("first-order Sobol indices", names, first)
+        print()
+        print_matrix("total Sobol indices", names, total)
+        print(f"{args.sobol} samples in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
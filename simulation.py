@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import compiler
+import equations
+
+# Time-stepping scenarios: each step evaluates the model for the current
+# sliders, then feedback rules move the sliders by the outputs. A rule set maps
+# a slider to {output name: rate}; every step the slider changes by
+# dt * sum(rate * output) and is clamped to the 0-100 slider range.
+#
+# simulate() runs one scenario with the fused scalar model and
+# simulate_batch() steps many at once as NumPy arrays; simulate_runs() picks
+# between them for a batch. All are generators of fixed-size record chunks, so
+# a run of any length only holds one chunk. Chunks go to numbered .npy files
+# next to a meta.json.
+#
+#   python simulation.py --steps 1000000 --state '{"humidity": 60, "population": 10}' --out runs/a
+#   python simulation.py --steps 100000 --random-runs 64 --workers 4 --out runs/batch
+
+FEEDBACK_RULES = {
+    # population grows with the harvest and shrinks with hunger and thirst
+    "population": {"crop_yield": 2e-5, "hunger": -0.05, "thirst": -0.05},
+    # humidity follows the rain and is drawn down by the water held on the ground
+    "humidity": {"rainfall_intensity": 2e-3, "water_resources": -1e-3},
+}
+INITIAL_STATE = {"solar_intensity": 50, "humidity": 50, "wind_speed": 10, "population": 10}
+SLIDER_RANGE = (0.0, 100.0)
+ARRAY_RUNS = 32  # below this many runs a batch steps each run with the scalar model
+OUTPUTS = [name for name, _ in equations.DEPENDENT_VARIABLES]
+RECORD_DTYPE = np.dtype([("step", np.int64)]
+                        + [(name, np.float64) for name in equations.INDEPENDENT_VARIABLES]
+                        + [(name, np.float64) for name in OUTPUTS])
+
+
+def check_rules(rules):
+    for variable, terms in rules.items():
+        if variable not in equations.INDEPENDENT_VARIABLES:
+            raise ValueError(f"feedback rule for unknown slider {variable!r}")
+        for output in terms:
+            if output not in OUTPUTS:
+                raise ValueError(f"feedback rule for {variable!r} reads unknown output {output!r}")
+    return rules
+
+
+def _rule_terms(rules):
+    # [(slider index, [(output index, rate), ...]), ...]
+    check_rules(rules)
+    return [(equations.INDEPENDENT_VARIABLES.index(variable),
+             [(OUTPUTS.index(output), rate) for output, rate in terms.items()])
+            for variable, terms in rules.items()]
+
+
+def simulate(initial, rules=FEEDBACK_RULES, steps=1000, dt=1.0, record_every=1, chunk_size=65536):
+    # Yields RECORD_DTYPE chunks of one run: the sliders at the start of each
+    # recorded step and the outputs they produced
+    evaluate = compiler.compile_scalar(name="step", positional=True, truncate=False)
+    terms = _rule_terms(rules)
+    low, high = SLIDER_RANGE
+    inputs = [float(initial[name]) for name in equations.INDEPENDENT_VARIABLES]
+    chunk = np.empty(chunk_size, dtype=RECORD_DTYPE)
+    filled = 0
+    for step in range(steps):
+        outputs = evaluate(*inputs)
+        if step % record_every == 0:
+            chunk[filled] = (step, *inputs, *outputs)
+            filled += 1
+            if filled == chunk_size:
+                yield chunk
+                chunk = np.empty(chunk_size, dtype=RECORD_DTYPE)
+                filled = 0
+        for index, contributions in terms:
+            value = inputs[index] + dt * sum(rate * outputs[output] for output, rate in contributions)
+            inputs[index] = low if value < low else high if value > high else value
+    if filled:
+        yield chunk[:filled]
+
+
+def simulate_batch(initials, rules=FEEDBACK_RULES, steps=1000, dt=1.0, record_every=1, chunk_size=4096):
+    # simulate() for many runs stepped together; chunks have shape (steps, runs)
+    terms = check_rules(rules)
+    low, high = SLIDER_RANGE
+    inputs = {name: np.array([float(initial[name]) for initial in initials])
+              for name in equations.INDEPENDENT_VARIABLES}
+    chunk = np.empty((chunk_size, len(initials)), dtype=RECORD_DTYPE)
+    filled = 0
+    for step in range(steps):
+        outputs = equations.calculate_dependent_arrays(*(inputs[name] for name in equations.INDEPENDENT_VARIABLES))
+        if step % record_every == 0:
+            row = chunk[filled]
+            row["step"] = step
+            for name, values in inputs.items():
+                row[name] = values
+            for name in OUTPUTS:
+                row[name] = outputs[name]
+            filled += 1
+            if filled == chunk_size:
+                yield chunk
+                chunk = np.empty((chunk_size, len(initials)), dtype=RECORD_DTYPE)
+                filled = 0
+        updated = {}
+        for variable, contributions in terms.items():
+            change = sum(rate * outputs[output] for output, rate in contributions.items())
+            updated[variable] = np.clip(inputs[variable] + dt * change, low, high)
+        inputs.update(updated)
+    if filled:
+        yield chunk[:filled]
+
+
+def simulate_runs(initials, rules=FEEDBACK_RULES, steps=1000, dt=1.0, record_every=1, chunk_size=4096):
+    # (steps, runs) chunks for any number of runs; NumPy only pays off once
+    # the per-step array overhead is shared by enough runs
+    if len(initials) >= ARRAY_RUNS:
+        yield from simulate_batch(initials, rules, steps, dt, record_every, chunk_size)
+        return
+    runs = [simulate(initial, rules, steps, dt, record_every, chunk_size) for initial in initials]
+    for chunks in zip(*runs):
+        yield np.stack(chunks, axis=1)
+
+
+def write_run(chunks, directory, meta):
+    # Streams chunks to directory/chunk_00000.npy, ... and returns the record
+    # count: one record per run per recorded step, whether the chunks are
+    # (steps,) or (steps, runs)
+    os.makedirs(directory, exist_ok=True)
+    records = 0
+    rows = 0
+    index = 0
+    for index, chunk in enumerate(chunks):
+        np.save(os.path.join(directory, f"chunk_{index:05d}.npy"), chunk)
+        records += chunk.size
+        rows += len(chunk)
+    with open(os.path.join(directory, "meta.json"), "w") as file:
+        json.dump({**meta, "records": records, "rows": rows, "chunks": index + 1 if records else 0,
+                   "fields": list(RECORD_DTYPE.names)}, file, indent=2)
+    return records
+
+
+def read_run(directory):
+    # the chunks of a written run, memory-mapped, in step order
+    with open(os.path.join(directory, "meta.json")) as file:
+        meta = json.load(file)
+    for index in range(meta["chunks"]):
+        yield np.load(os.path.join(directory, f"chunk_{index:05d}.npy"), mmap_mode="r")
+
+
+def run_single(initial, rules, steps, dt, record_every, directory):
+    # one scenario on its own, written as (steps,) chunks
+    meta = {"initial": initial, "rules": rules, "steps": steps, "dt": dt, "record_every": record_every}
+    return directory, write_run(simulate(initial, rules, steps, dt, record_every), directory, meta)
+
+
+def run_batch(initials, rules, steps, dt, record_every, directory):
+    # always (steps, runs) chunks, even for a batch of one run
+    meta = {"initial": initials, "rules": rules, "steps": steps, "dt": dt, "record_every": record_every}
+    return directory, write_run(simulate_runs(initials, rules, steps, dt, record_every), directory, meta)
+
+
+def run_parallel(initials, out_dir, rules=FEEDBACK_RULES, steps=1000, dt=1.0, record_every=1, workers=None,
+                 batch_size=None, progress=True):
+    # Independent runs split into batches over a process pool; batch i is
+    # written to out_dir/batch_00i, where column j of every chunk is its j-th run
+    workers = workers or os.cpu_count() or 1
+    batch_size = batch_size or max(1, -(-len(initials) // workers))
+    batches = [initials[begin:begin + batch_size] for begin in range(0, len(initials), batch_size)]
+    records = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_batch, batch, rules, steps, dt, record_every,
+                               os.path.join(out_dir, f"batch_{index:03d}"))
+                   for index, batch in enumerate(batches)]
+        for future in as_completed(futures):
+            directory, count = future.result()
+            records += count
+            if progress:
+                print(f"{directory}: {count} records", file=sys.stderr)
+    return records
+
+
+def load_states(text):
+    # a JSON object or list of objects, or the path of a file holding one
+    if os.path.exists(text):
+        with open(text) as file:
+            text = file.read()
+    states = json.loads(text)
+    if isinstance(states, dict):
+        states = [states]
+    return [{**INITIAL_STATE, **state} for state in states]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the model forward in time with feedback from outputs to sliders.")
+    parser.add_argument("--state", default="{}",
+                        help="starting sliders as JSON (object or list of objects) or a JSON file")
+    parser.add_argument("--random-runs", type=int, default=0, help="add this many runs with random starting sliders")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --random-runs")
+    parser.add_argument("--rules", help="JSON file of feedback rules {slider: {output: rate}} (default: built in)")
+    parser.add_argument("--steps", type=int, default=100000, help="timesteps per run")
+    parser.add_argument("--dt", type=float, default=1.0, help="timestep")
+    parser.add_argument("--record-every", type=int, default=1, help="keep every n-th step")
+    parser.add_argument("--workers", type=int, default=None, help="processes for several runs (default: all cores)")
+    parser.add_argument("--out", default="simulation", help="output directory")
+    args = parser.parse_args(argv)
+
+    initials = load_states(args.state) if args.state != "{}" or not args.random_runs else []
+    rng = random.Random(args.seed)
+    initials += [{name: rng.uniform(*SLIDER_RANGE) for name in equations.INDEPENDENT_VARIABLES}
+                 for _ in range(args.random_runs)]
+    rules = FEEDBACK_RULES
+    if args.rules:
+        with open(args.rules) as file:
+            rules = check_rules(json.load(file))
+
+    start = time.perf_counter()
+    if len(initials) == 1:
+        _, records = run_single(initials[0], rules, args.steps, args.dt, args.record_every, args.out)
+    else:
+        records = run_parallel(initials, args.out, rules, args.steps, args.dt, args.record_every, args.workers)
+    elapsed = time.perf_counter() - start
+    steps = args.steps * len(initials)
+    print(f"{len(initials)} run(s), {steps} steps in {elapsed:.2f}s: {steps / elapsed:,.0f} steps/s, "
+          f"{records} records in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
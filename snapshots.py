@@ -0,0 +1,470 @@
+import argparse
+import math
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+import equations
+
+# Saved slider states.
+#
+# A snapshot is a small binary file: a header (magic, format version and the
+# slider names it was written with) followed by one record of doubles (the
+# save time, then one value per slider). The newest state lives in
+# SNAPSHOT_FILE, which is only ever replaced whole (temp file + os.replace), so
+# a crash mid-save leaves the previous snapshot intact. Every save is also
+# appended to HISTORY_FILE: the same header, then fixed-size records, so entry
+# i sits at header + i * record size and the whole history maps as one NumPy
+# array without parsing.
+#
+# Reading migrates older data to the current sliders: the pickled
+# saved_variables.pkl of earlier versions (which may still carry the old
+# temperature slider), and snapshots written with other slider names.
+# Autosaver writes on a background thread, some time after the last change,
+# so a save never runs inside a frame.
+#
+#   python snapshots.py list
+#   python snapshots.py show -1
+#   python snapshots.py restore 3
+
+MAGIC = b"PLSN"
+FORMAT_VERSION = 1
+INPUTS = list(equations.INDEPENDENT_VARIABLES)
+SNAPSHOT_FILE = "planet.snap"
+HISTORY_FILE = "planet_history.snap"
+LEGACY_FILE = "saved_variables.pkl"  # pickled dict of the versions before FORMAT_VERSION 1
+SLIDER_RANGE = (0.0, 100.0)
+DEFAULTS = equations.DEFAULT_VARIABLES
+
+_PREFIX = struct.Struct("<4sHH")  # magic, version, number of fields
+_NAME_LENGTH = struct.Struct("<B")
+
+
+def _header(names):
+    parts = [_PREFIX.pack(MAGIC, FORMAT_VERSION, len(names))]
+    for name in names:
+        encoded = name.encode("utf-8")
+        parts.append(_NAME_LENGTH.pack(len(encoded)) + encoded)
+    return b"".join(parts)
+
+
+def _record(names):
+    # save time, then one double per field
+    return struct.Struct(f"<{len(names) + 1}d")
+
+
+def read_header(file):
+    # (version, names, header size) of an open snapshot or history file
+    prefix = file.read(_PREFIX.size)
+    if len(prefix) < _PREFIX.size:
+        raise ValueError("truncated header")
+    magic, version, count = _PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise ValueError("not a snapshot file")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"snapshot format {version} is newer than this program ({FORMAT_VERSION})")
+    names = []
+    size = _PREFIX.size
+    for _ in range(count):
+        length = file.read(_NAME_LENGTH.size)
+        if len(length) < _NAME_LENGTH.size:
+            raise ValueError("truncated header")
+        (length,) = _NAME_LENGTH.unpack(length)
+        name = file.read(length)
+        if len(name) < length:
+            raise ValueError("truncated header")
+        names.append(name.decode("utf-8"))
+        size += _NAME_LENGTH.size + length
+    return version, names, size
+
+
+def _from_temperature(values, defaults):
+    # Version 0 -> 1: temperature was a slider before solar intensity
+    # replaced it, and temperature = 0.02 * humidity + solar_intensity. Files
+    # saved after the switch still carry the old temperature next to the
+    # default solar intensity the loader filled in, so that default does not
+    # count as a setting.
+    values = dict(values)
+    temperature = values.pop("temperature", None)
+    if temperature is not None and values.get("solar_intensity", defaults["solar_intensity"]) == defaults["solar_intensity"]:
+        humidity = _number(values.get("humidity"), defaults["humidity"])
+        solar = _number(temperature, math.nan) - 0.02 * humidity
+        if math.isfinite(solar):
+            values["solar_intensity"] = max(SLIDER_RANGE[0], min(SLIDER_RANGE[1], solar))
+    return values
+
+
+# MIGRATIONS[v] turns the values of format v into those of format v + 1
+MIGRATIONS = {0: _from_temperature}
+
+
+def _number(value, default):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return float(default)
+    return value if math.isfinite(value) else float(default)
+
+
+def fit(values, defaults=DEFAULTS):
+    # the current sliders from any saved mapping: missing or unusable
+    # values fall back to the defaults and unknown names are dropped
+    return {name: _number(values.get(name, defaults[name]), defaults[name]) for name in INPUTS}
+
+
+def migrate(values, version, defaults=DEFAULTS):
+    for step in range(version, FORMAT_VERSION):
+        values = MIGRATIONS[step](values, defaults)
+    return fit(values, defaults)
+
+
+def load_legacy(path=LEGACY_FILE, defaults=DEFAULTS):
+    with open(path, "rb") as file:
+        values = pickle.load(file)
+    if not isinstance(values, dict):
+        raise ValueError(f"{path} does not hold a dict of sliders")
+    return migrate(values, 0, defaults)
+
+
+def atomic_write(path, data):
+    # readers see the old file or the new one, never a partial write
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def write_snapshot(path, variables, timestamp=None):
+    timestamp = time.time() if timestamp is None else timestamp
+    data = _header(INPUTS) + _record(INPUTS).pack(timestamp, *(float(variables[name]) for name in INPUTS))
+    atomic_write(path, data)
+
+
+def read_snapshot(path, defaults=DEFAULTS):
+    # (timestamp, sliders)
+    with open(path, "rb") as file:
+        version, names, _ = read_header(file)
+        record = _record(names)
+        data = file.read(record.size)
+    if len(data) < record.size:
+        raise ValueError("truncated snapshot")
+    timestamp, *values = record.unpack(data)
+    return timestamp, migrate(dict(zip(names, values)), version, defaults)
+
+
+class History:
+    # Append-only log of saved states. len() and indexing (negative indices
+    # count from the newest) only touch the records asked for; records() maps
+    # the whole file as a structured array with a "time" column and one
+    # column per slider.
+    def __init__(self, path=HISTORY_FILE, defaults=DEFAULTS):
+        self.path = path
+        self.defaults = defaults
+        self.record = _record(INPUTS)
+        self.dtype = np.dtype([("time", "<f8")] + [(name, "<f8") for name in INPUTS])
+        self._lock = threading.Lock()
+        self._mapped = None
+        self._open()
+
+    def _open(self):
+        # the file itself is created by the first append
+        self.offset = len(_header(INPUTS))
+        if not self._exists():
+            return
+        with open(self.path, "rb") as file:
+            version, names, self.offset = read_header(file)
+        if version != FORMAT_VERSION or names != INPUTS:
+            self._migrate_file(version, names)
+            return
+        # a save interrupted mid-append leaves a partial record at the end
+        whole = self.offset + len(self) * self.record.size
+        if os.path.getsize(self.path) != whole:
+            with open(self.path, "r+b") as file:
+                file.truncate(whole)
+
+    def _migrate_file(self, version, names):
+        # rewrites an older history for the current sliders in one go
+        record = _record(names)
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            data = file.read()
+        parts = [_header(INPUTS)]
+        for start in range(0, len(data) - record.size + 1, record.size):
+            timestamp, *values = record.unpack_from(data, start)
+            values = migrate(dict(zip(names, values)), version, self.defaults)
+            parts.append(self.record.pack(timestamp, *(values[name] for name in INPUTS)))
+        atomic_write(self.path, b"".join(parts))
+        self.offset = len(parts[0])
+
+    def _exists(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def __len__(self):
+        if not self._exists():
+            return 0
+        return max(0, os.path.getsize(self.path) - self.offset) // self.record.size
+
+    def append(self, variables, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        data = self.record.pack(timestamp, *(float(variables[name]) for name in INPUTS))
+        with self._lock:
+            if not self._exists():
+                atomic_write(self.path, _header(INPUTS))
+            with open(self.path, "ab") as file:
+                file.write(data)
+        return timestamp
+
+    def __getitem__(self, index):
+        # (timestamp, sliders) of one entry
+        with self._lock:
+            count = len(self)
+            if index < 0:
+                index += count
+            if not 0 <= index < count:
+                raise IndexError("history index out of range")
+            with open(self.path, "rb") as file:
+                file.seek(self.offset + index * self.record.size)
+                timestamp, *values = self.record.unpack(file.read(self.record.size))
+        return timestamp, dict(zip(INPUTS, values))
+
+    def records(self):
+        # read-only view of every entry; remapped only when the file has grown
+        with self._lock:
+            count = len(self)
+            if self._mapped is None or len(self._mapped) != count:
+                if count == 0:
+                    self._mapped = np.zeros(0, dtype=self.dtype)
+                else:
+                    self._mapped = np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.offset, shape=(count,))
+            return self._mapped
+
+    def find(self, timestamp):
+        # index of the newest entry saved at or before timestamp, or None
+        index = int(np.searchsorted(self.records()["time"], timestamp, side="right")) - 1
+        return index if index >= 0 else None
+
+
+class SnapshotStore:
+    # the current snapshot plus its history, with the legacy pickle as the
+    # last thing to fall back on
+    def __init__(self, path=SNAPSHOT_FILE, history_path=HISTORY_FILE, legacy_path=LEGACY_FILE, defaults=DEFAULTS):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.defaults = defaults
+        self.history = History(history_path, defaults)
+        self.source = None
+
+    def load(self):
+        # the newest saved sliders, or the defaults; self.source says where they came from
+        if os.path.exists(self.path):
+            try:
+                _, values = read_snapshot(self.path, self.defaults)
+                self.source = self.path
+                return values
+            except (OSError, ValueError, struct.error) as error:
+                print(f"{self.path} is unreadable ({error}), trying the history", file=sys.stderr)
+        if len(self.history):
+            self.source = self.history.path
+            return fit(self.history[-1][1], self.defaults)
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            try:
+                values = load_legacy(self.legacy_path, self.defaults)
+                self.source = self.legacy_path
+                return values
+            except Exception as error:
+                print(f"{self.legacy_path} is unreadable ({error}), using the defaults", file=sys.stderr)
+        self.source = None
+        return fit(self.defaults, self.defaults)
+
+    def save(self, variables, timestamp=None):
+        timestamp = self.history.append(variables, timestamp)
+        write_snapshot(self.path, variables, timestamp)
+        return timestamp
+
+    def restore(self, variables, timestamp=None):
+        # makes a state current without a new history entry, for states
+        # taken from the history
+        timestamp = time.time() if timestamp is None else timestamp
+        write_snapshot(self.path, variables, timestamp)
+        return timestamp
+
+
+class Autosaver:
+    # Debounced background saves: request() hands over a copy of the sliders
+    # and returns at once; the worker writes the newest copy once no request
+    # has come for `delay` seconds (or `max_delay` after the first unsaved
+    # one, so a long drag is still saved). Requests that arrive in between
+    # replace each other, and a state equal to the last one written is not
+    # written again. restore() requests write only the current snapshot.
+    def __init__(self, store, delay=1.0, max_delay=5.0, name="autosave"):
+        self.store = store
+        self.delay = delay
+        self.max_delay = max_delay
+        self.requested = 0
+        self.written = 0
+        self.coalesced = 0  # requests replaced before they were written
+        self.unchanged = 0  # requests equal to what was already saved
+        self.last_seconds = 0.0
+        self.error = None
+        self._pending = None
+        self._due = 0.0
+        self._deadline = 0.0
+        self._force = False
+        self._history = True
+        self._writing = False
+        self._last = None
+        self._wanted = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def request(self, variables, delay=None, force=False, history=True):
+        snapshot = {name: variables[name] for name in INPUTS}
+        now = time.monotonic()
+        with self._wanted:
+            if self._pending is None:
+                self._deadline = now + self.max_delay
+            else:
+                self.coalesced += 1
+            self._pending = snapshot
+            self._due = min(now + (self.delay if delay is None else delay), self._deadline)
+            self._force = self._force or force
+            self._history = history  # the newest request decides
+            self.requested += 1
+            self._wanted.notify_all()
+
+    def save(self, variables):
+        # an explicit save: written as soon as the worker gets to it
+        self.request(variables, delay=0.0, force=True)
+
+    def restore(self, variables):
+        # a state browsed to in the history: debounced like any change, but
+        # not appended to the history again
+        self.request(variables, history=False)
+
+    def _run(self):
+        while True:
+            with self._wanted:
+                while True:
+                    if self._pending is None:
+                        if self._closed:
+                            return
+                        self._wanted.wait()
+                        continue
+                    remaining = self._due - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        break
+                    self._wanted.wait(remaining)
+                snapshot, self._pending = self._pending, None
+                force, self._force = self._force, False
+                history, self._history = self._history, True
+                self._writing = True
+            if snapshot == self._last and not force:
+                self.unchanged += 1
+            else:
+                start = time.perf_counter()
+                try:
+                    if history:
+                        self.store.save(snapshot)
+                    else:
+                        self.store.restore(snapshot)
+                    self._last = snapshot
+                    self.written += 1
+                    self.last_seconds = time.perf_counter() - start
+                except OSError as error:
+                    # a full disk or a locked file must not take the app down;
+                    # the next request tries again
+                    self.error = error
+                    print(f"autosave failed: {error}", file=sys.stderr)
+            with self._wanted:
+                self._writing = False
+                self._wanted.notify_all()
+
+    def flush(self, timeout=None):
+        # writes any pending request now and waits for it; False on timeout
+        with self._wanted:
+            self._due = 0.0
+            self._wanted.notify_all()
+            return self._wanted.wait_for(lambda: self._pending is None and not self._writing, timeout)
+
+    def close(self):
+        # pending changes are written before the worker stops
+        with self._wanted:
+            self._closed = True
+            self._wanted.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "requested": self.requested,
+            "written": self.written,
+            "coalesced": self.coalesced,
+            "unchanged": self.unchanged,
+            "last_seconds": self.last_seconds,
+        }
+
+
+def _describe(index, timestamp, values):
+    when = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+    return f"{index:>6}  {when}" + "".join(f"{values[name]:>17.6g}" for name in INPUTS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect, restore and migrate saved slider states.")
+    parser.add_argument("--snapshot", default=SNAPSHOT_FILE, help="current snapshot file")
+    parser.add_argument("--history", default=HISTORY_FILE, help="history file")
+    parser.add_argument("--legacy", default=LEGACY_FILE, help="pickle save file of earlier versions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="print the history")
+    listing.add_argument("--last", type=int, help="only the newest N entries")
+    show = commands.add_parser("show", help="print one history entry (negative counts from the newest)")
+    show.add_argument("index", type=int)
+    restore = commands.add_parser("restore", help="make a history entry the current snapshot")
+    restore.add_argument("index", type=int)
+    commands.add_parser("migrate", help="convert the legacy pickle into a snapshot")
+    args = parser.parse_args(argv)
+
+    store = SnapshotStore(args.snapshot, args.history, args.legacy)
+    history = store.history
+    if args.command == "list":
+        records = history.records()
+        begin = 0 if args.last is None else max(0, len(records) - args.last)
+        print(f"{'#':>6}  {'saved':<19}" + "".join(f"{name:>17}" for name in INPUTS))
+        for index in range(begin, len(records)):
+            entry = records[index]
+            print(_describe(index, float(entry["time"]), {name: float(entry[name]) for name in INPUTS}))
+        print(f"{len(records)} saved state(s) in {args.history}")
+    elif args.command in ("show", "restore"):
+        try:
+            timestamp, values = history[args.index]
+        except IndexError:
+            parser.error(f"no entry {args.index} in a history of {len(history)}")
+        print(_describe(args.index % len(history), timestamp, values))
+        if args.command == "restore":
+            store.restore(values)
+            print(f"written to {args.snapshot}")
+    elif args.command == "migrate":
+        if not os.path.exists(args.legacy):
+            parser.error(f"{args.legacy} does not exist")
+        values = load_legacy(args.legacy)
+        store.save(values)
+        print(f"{args.legacy} -> {args.snapshot}: {values}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+from array import array
+from collections.abc import MutableMapping
+
+import numpy as np
+
+import compiler
+import equations
+
+# One schema for a planet's sliders and outputs. PlanetState keeps all 23
+# values in one flat array of doubles (the four sliders, then the outputs in
+# DEPENDENT_VARIABLES order) and exposes that same storage as attributes
+# (state.plants_density), as a mapping by machine name (state.names), as a
+# mapping by display label (state.labels["Plants Density"]) and as a NumPy
+# array (state.array). StateModel evaluates the fused model straight into the
+# array, so a frame neither builds nor looks up a dict.
+
+INPUTS = list(equations.INDEPENDENT_VARIABLES)
+OUTPUTS = [name for name, _ in equations.DEPENDENT_VARIABLES]
+FIELDS = INPUTS + OUTPUTS
+INDEX = {name: index for index, name in enumerate(FIELDS)}
+LABELS = {label: INDEX[name] for name, label in equations.DEPENDENT_VARIABLES}
+
+
+class FieldView(MutableMapping):
+    # a dict-like window onto PlanetState.values; keys map to fixed slots
+    __slots__ = ("values", "index")
+
+    def __init__(self, values, index):
+        self.values = values
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.values[self.index[key]]
+
+    def __setitem__(self, key, value):
+        self.values[self.index[key]] = value
+
+    def __delitem__(self, key):
+        raise TypeError("the fields of a planet state are fixed")
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class PlanetState:
+    __slots__ = ("values", "array", "names", "labels")
+
+    def __init__(self, variables=None):
+        self.values = array("d", bytes(8 * len(FIELDS)))
+        self.array = np.frombuffer(self.values, dtype=np.float64)
+        self.names = FieldView(self.values, INDEX)
+        self.labels = FieldView(self.values, LABELS)
+        if variables is not None:
+            self.load_inputs(variables)
+
+    def load_inputs(self, variables):
+        # copies the sliders in; True when any of them changed
+        values = self.values
+        changed = False
+        for index, name in enumerate(INPUTS):
+            value = variables[name]
+            if values[index] != value:
+                values[index] = value
+                changed = True
+        return changed
+
+    def copy_from(self, other):
+        self.values[:] = other.values
+
+    def inputs(self):
+        return {name: self.values[index] for index, name in enumerate(INPUTS)}
+
+    def dependent_variables(self):
+        # the dict calculate_dependent_variables returns, for code that still wants one
+        return {label: int(self.values[index]) for label, index in LABELS.items()}
+
+    def __repr__(self):
+        return f"PlanetState({dict(self.names.items())})"
+
+
+def _field(index):
+    def get(self):
+        return self.values[index]
+
+    def set(self, value):
+        self.values[index] = value
+    return property(get, set)
+
+
+for _name, _index in INDEX.items():
+    setattr(PlanetState, _name, _field(_index))
+
+
+class StateModel:
+    # The fused equations evaluating in place: outputs are truncated with
+    # int() like calculate_dependent_variables, and stored as doubles
+    def __init__(self, model=compiler.MODEL):
+        self.evaluate_into = compiler.compile_into(model, offset=len(INPUTS))
+        self.evaluations = 0
+
+    def evaluate(self, state):
+        self.evaluate_into(state.values)
+        self.evaluations += 1
+        return state
+
+    def update(self, state, variables):
+        # loads the sliders and re-evaluates only if one of them moved
+        if state.load_inputs(variables):
+            self.evaluate(state)
+            return True
+        return False
@@ -0,0 +1,129 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+import equations
+
+# Headless parameter sweep over the four slider inputs. Only needs numpy and
+# equations, so it runs on batch nodes without pygame installed.
+#
+#   python sweep.py --step 0.25 --out sweep.npy
+#   python sweep.py --step 5 --axis population=0:50:1 --workers 8 --no-output
+
+OUTPUT_DTYPE = np.dtype(
+    [(name, np.float64) for name in equations.INDEPENDENT_VARIABLES]
+    + [(name, np.int64) for name, _ in equations.DEPENDENT_VARIABLES]
+)
+
+
+def axis_values(start, stop, step):
+    if step <= 0:
+        raise ValueError("step must be positive")
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return start + step * np.arange(count)
+
+
+def parse_axis(text):
+    name, _, spec = text.partition("=")
+    if name not in equations.INDEPENDENT_VARIABLES:
+        raise argparse.ArgumentTypeError(f"unknown variable {name!r}")
+    try:
+        start, stop, step = (float(part) for part in spec.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected {name}=start:stop:step, got {text!r}")
+    return name, (start, stop, step)
+
+
+def evaluate_chunk(axes, begin, end):
+    shape = tuple(len(values) for values in axes)
+    indices = np.unravel_index(np.arange(begin, end), shape)
+    inputs = [values[index] for values, index in zip(axes, indices)]
+    outputs = equations.calculate_dependent_arrays(*inputs)
+
+    chunk = np.empty(end - begin, dtype=OUTPUT_DTYPE)
+    for name, values in zip(equations.INDEPENDENT_VARIABLES, inputs):
+        chunk[name] = values
+    for name, _ in equations.DEPENDENT_VARIABLES:
+        chunk[name] = outputs[name]  # int() truncation, same as the scalar path
+    return begin, chunk
+
+
+def run_sweep(axes, out_path=None, chunk_size=250_000, workers=None, progress=True):
+    total = int(np.prod([len(values) for values in axes]))
+    workers = workers or os.cpu_count() or 1
+    output = None
+    if out_path:
+        output = np.lib.format.open_memmap(out_path, mode="w+", dtype=OUTPUT_DTYPE, shape=(total,))
+
+    # Only a few chunks are in flight at once so memory stays flat even when
+    # the disk is slower than the workers.
+    max_pending = 2 * workers
+    chunks = ((begin, min(begin + chunk_size, total)) for begin in range(0, total, chunk_size))
+    done = 0
+    start = time.perf_counter()
+    last_report = start
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for begin, end in chunks:
+            pending.add(pool.submit(evaluate_chunk, axes, begin, end))
+            if len(pending) < max_pending:
+                continue
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done += write_chunk(output, *future.result())
+            now = time.perf_counter()
+            if progress and now - last_report >= 1.0:
+                last_report = now
+                rate = done / (now - start)
+                print(f"{done}/{total} points ({100 * done / total:.1f}%), {rate:,.0f} points/s",
+                      file=sys.stderr)
+        for future in pending:
+            done += write_chunk(output, *future.result())
+
+    if output is not None:
+        output.flush()
+        del output
+    elapsed = time.perf_counter() - start
+    return total, elapsed
+
+
+def write_chunk(output, begin, chunk):
+    if output is not None:
+        output[begin:begin + len(chunk)] = chunk
+    return len(chunk)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the equations model over a grid of slider values.")
+    parser.add_argument("--start", type=float, default=0.0, help="grid start for every axis (default 0)")
+    parser.add_argument("--stop", type=float, default=100.0, help="grid stop for every axis, inclusive (default 100)")
+    parser.add_argument("--step", type=float, default=1.0, help="grid step for every axis (default 1)")
+    parser.add_argument("--axis", type=parse_axis, action="append", default=[], metavar="NAME=START:STOP:STEP",
+                        help="override the grid of one variable, e.g. humidity=0:100:0.5")
+    parser.add_argument("--chunk-size", type=int, default=250_000, help="points per work item")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--out", default="sweep.npy", help="output .npy file (structured array, memory-mappable)")
+    parser.add_argument("--no-output", action="store_true", help="only measure throughput, write nothing")
+    args = parser.parse_args(argv)
+
+    grids = {name: (args.start, args.stop, args.step) for name in equations.INDEPENDENT_VARIABLES}
+    grids.update(args.axis)
+    axes = [axis_values(*grids[name]) for name in equations.INDEPENDENT_VARIABLES]
+
+    total = int(np.prod([len(values) for values in axes]))
+    size = total * OUTPUT_DTYPE.itemsize
+    print(f"grid: {' x '.join(str(len(values)) for values in axes)} = {total} points", file=sys.stderr)
+    if not args.no_output:
+        print(f"writing {size / 2**20:,.1f} MiB to {args.out}", file=sys.stderr)
+
+    total, elapsed = run_sweep(axes, None if args.no_output else args.out,
+                               chunk_size=args.chunk_size, workers=args.workers)
+    print(f"{total} points in {elapsed:.2f}s: {total / elapsed:,.0f} points/s")
+
+
+if __name__ == "__main__":
+    main()
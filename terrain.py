@@ -0,0 +1,148 @@
+import hashlib
+import os
+from functools import lru_cache
+
+import numpy as np
+import pygame
+
+from layers import surface_pool
+
+# Terrain colour rules and a whole-array rasterizer for the planet disk.
+# Nothing in here touches the display, so it can be used headless.
+
+SANDY = (205, 133, 63)
+BLUE1 = (70, 130, 180)  # Water
+LIGHT_GREEN = (144, 238, 144)  # Sparse plants
+BROWN = (139, 69, 19)  # Dry areas
+GREEN = (34, 139, 34)
+
+# (scale, weight) of each simplex octave summed into the terrain noise
+NOISE_OCTAVES = ((50, 1.0), (30, 0.5), (10, 0.25))
+
+# octave-summed noise fields are cached here as .npy files and memory-mapped on
+# later starts; the file name is a hash of everything the field depends on
+NOISE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".noise_cache")
+NOISE_CACHE_VERSION = 1
+
+# terrain bands of get_terrain_color, plus one for pixels outside the disk
+DRY, SPARSE, WET, OUTSIDE = 0, 1, 2, 3
+BAND_NOISE = (-1.0, -0.05, 1.0)  # any noise value inside each band
+
+
+def get_terrain_color(noise_value, rainfall, plant_density):
+    # Adjust plant density effect
+    if plant_density < 50:
+        plant_factor = plant_density / 50  # Gradually fades to brown
+    elif plant_density > 500:
+        plant_factor = max(0, (200 - plant_density) / 100)#max(0, 1 - (plant_density - 100) / 100)  # Gradually turns brown again
+    else:
+        plant_factor = 1  # Most green in 50-100 range
+
+    # Adjust rainfall effect
+    if rainfall < 80000:
+        rain_factor = 0  # No blue for very low rainfall
+    elif rainfall > 90000:
+        rain_factor = max(0, 1 - (rainfall - 90000) / 10000)  # Gradually fades out above 90000
+    else:
+        rain_factor = (rainfall - 80000) / (90000 - 80000)  # Most blue in 80000-90000 range
+
+    if noise_value < -0.1:
+        transition = plant_factor  # Use adjusted plant density
+        r = int(BROWN[0] * (1 - transition) + GREEN[0] * transition)
+        g = int(BROWN[1] * (1 - transition) + GREEN[1] * transition)
+        b = int(BROWN[2] * (1 - transition) + GREEN[2] * transition)
+    elif noise_value < 0:
+        transition = rain_factor  # Use adjusted rainfall
+        r = int(SANDY[0] * (1 - transition) + LIGHT_GREEN[0] * transition)
+        g = int(SANDY[1] * (1 - transition) + LIGHT_GREEN[1] * transition)
+        b = int(SANDY[2] * (1 - transition) + LIGHT_GREEN[2] * transition)
+    else:
+        transition = rain_factor  # Use adjusted rainfall
+        r = int(BROWN[0] * (1 - transition) + BLUE1[0] * transition)
+        g = int(BROWN[1] * (1 - transition) + BLUE1[1] * transition)
+        b = int(BROWN[2] * (1 - transition) + BLUE1[2] * transition)
+
+    return (max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b)))
+
+
+@lru_cache(maxsize=256)
+def band_colors(rainfall, plant_density):
+    # the colour of each band; get_terrain_color only looks at which band the noise is in
+    return tuple(get_terrain_color(noise, rainfall, plant_density) for noise in BAND_NOISE)
+
+
+def noise_field(simplex, xs, ys):
+    # get_noise_value for every (x, y) in the grid, shape (len(ys), len(xs))
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    field = None
+    for scale, weight in NOISE_OCTAVES:
+        octave = weight * simplex.noise2array(xs / scale, ys / scale)
+        field = octave if field is None else field + octave
+    return field
+
+
+def cached_noise_field(simplex, xs, ys, cache_dir=NOISE_CACHE_DIR):
+    # noise_field, computed once per seed, octave set and grid and then read
+    # back from disk
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    key = hashlib.sha1(repr((NOISE_CACHE_VERSION, simplex.get_seed(), NOISE_OCTAVES)).encode())
+    key.update(xs.tobytes())
+    key.update(ys.tobytes())
+    path = os.path.join(cache_dir, f"noise_{key.hexdigest()[:16]}.npy")
+    try:
+        return np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+
+    field = noise_field(simplex, xs, ys)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(temporary, "wb") as file:
+            np.save(file, field)
+        os.replace(temporary, path)
+    except OSError:
+        # a read-only checkout just recomputes on every start; a failed
+        # write (a full disk) leaves no partial file behind
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+    return field
+
+
+def terrain_bands(noise):
+    return np.where(noise < -0.1, DRY, np.where(noise < 0, SPARSE, WET)).astype(np.uint8)
+
+
+class TerrainRaster:
+    # The planet disk as cell x cell squares whose top-left corner lies inside
+    # the radius, the same cells draw_planet used to fill one rect at a time.
+    # The disk is rendered once into an 8-bit surface of band ids; a slider
+    # change only rewrites the three palette entries.
+    def __init__(self, simplex, center, radius, cell=3):
+        center_x, center_y = center
+        self.origin = (center_x - radius, center_y - radius)
+        xs = np.arange(center_x - radius, center_x + radius, cell)
+        ys = np.arange(center_y - radius, center_y + radius, cell)
+
+        distance = np.sqrt((xs[None, :] - center_x) ** 2 + (ys[:, None] - center_y) ** 2)
+        bands = terrain_bands(cached_noise_field(simplex, xs, ys))
+        bands[distance > radius] = OUTSIDE
+
+        self.surface = surface_pool.acquire((len(xs) * cell, len(ys) * cell), depth=8)
+        pixels = pygame.surfarray.pixels2d(self.surface)
+        pixels[:] = np.repeat(np.repeat(bands, cell, axis=0), cell, axis=1).T
+        del pixels
+        self.surface.set_colorkey(OUTSIDE)
+        self.colors = None
+
+    def draw(self, target, rainfall, plant_density):
+        colors = band_colors(rainfall, plant_density)
+        if colors != self.colors:
+            self.colors = colors
+            for band, color in enumerate(colors):
+                self.surface.set_palette_at(band, color)
+        target.blit(self.surface, self.origin)
@@ -9,6 +9,7 @@ import noise  # Adding the noise library for terrain generation
 from opensimplex import OpenSimplex
 import equations
 from functools import lru_cache
+from state import PlanetState, StateModel
 
 # Initialize Pygame
 pygame.init()
@@ -255,6 +256,11 @@ def draw_button(x, y, width, height, text, color, hover_color, is_hovering):
     screen.blit(text_surface, (text_x, text_y))
 
 # Main Simulation Loop
+# the model writes its outputs into planet_state; read them as planet_state.asi
+# or planet_state.labels["ASI"]
+state_model = StateModel()
+planet_state = PlanetState()
+planet_state.array[:] = math.nan  # nothing evaluated yet
 running = True
 dragging_slider = None
 while running:
@@ -282,20 +288,18 @@ while running:
             value = max(0, min(100, (relative_x / width) * 100))
             variables[var] = value
 
-    dependent_variables = calculate_dependent_variables(variables)
-
     # Draw the planet and terrain
     # draw_dynamic_planet(variables)
 
-    dependent_variables = equations.calculate_dependent_variables(variables)
+    state_model.update(planet_state, variables)
     # rainfall = dependent_variables.get("rainfall_area", 50)  # Update rainfall
     # plants_density = dependent_variables.get("plants_density")  # Update plant density
-    plants_density = max(0, min(100, dependent_variables.get("plants_density", 0))) #subtract pollution to make it darker based on pollution levels
+    plants_density = max(0, min(100, planet_state.plants_density)) #subtract pollution to make it darker based on pollution levels
     # rainfall_area = max(0, min(100, dependent_variables.get("rainfall_area", 0)))
-    rainfall_area = dependent_variables.get("rainfall_area", 0) / 1000000000
-    asi = dependent_variables.get("asi") / 100
-    solar_intensity = dependent_variables.get("solar_intensity") / 100
-    cloud_density = int(dependent_variables.get("cloud_density"))
+    rainfall_area = planet_state.rainfall_area / 1000000000
+    asi = planet_state.asi / 100
+    solar_intensity = variables["solar_intensity"] / 100
+    cloud_density = int(planet_state.cloud_density)
     # print("rainfall area =", rainfall_area)
     # print("Solar intensity =", solar_intensity)
     print("Cloud density =", cloud_density)
@@ -306,7 +310,7 @@ while running:
     for slider in independent_sliders:
         draw_slider(slider["x"], slider["y"], slider["width"], variables[slider["var"]], slider["label"])
 
-    draw_dependent_variables(dependent_variables)
+    draw_dependent_variables(planet_state.labels)
 
     mouse_pos = pygame.mouse.get_pos()
     is_hovering_default = 50 <= mouse_pos[0] <= 170 and 500 <= mouse_pos[1] <= 540
@@ -7,6 +7,7 @@ from opensimplex import OpenSimplex
 import eq
 from functools import lru_cache
 import equations 
+from state import PlanetState, StateModel
 
 pygame.init()
 simplex = OpenSimplex(seed=42)
@@ -34,12 +35,7 @@ BROWN = (139, 69, 19)  # Dry areas
 font = pygame.font.Font(None, 30)
 
 # Independent variables (sliders)
-default_variables = {
-    "solar_intensity": 0,  
-    "humidity": 50,     
-    "wind_speed": 10,   
-    "population": 1000  
-}
+default_variables = dict(equations.DEFAULT_VARIABLES)
 
 # Load saved variables if the file exists
 SAVE_FILE = "saved_variables.pkl"
@@ -269,6 +265,11 @@ def draw_stars():
         stars[i] = (x, y, speed, size)  # U
 
 
+# the model writes its outputs into planet_state; read them as planet_state.asi
+# or planet_state.labels["ASI"]
+state_model = StateModel()
+planet_state = PlanetState()
+planet_state.array[:] = math.nan  # nothing evaluated yet
 running = True
 dragging_slider = None
 while running:
@@ -296,20 +297,20 @@ while running:
             value = max(0, min(100, (relative_x / width) * 100))
             variables[var] = value
 
-    dependent_variables = equations.calculate_dependent_variables(variables)
+    state_model.update(planet_state, variables)
 
-    plants_density = max(0, min(100, dependent_variables.get("plants_density"))) 
-    rainfall_area = dependent_variables.get("rainfall_area") 
-    asi = dependent_variables.get("asi") 
-    cloud_density = int(dependent_variables.get("cloud_density"))
-    rainfall_intensity = dependent_variables.get("rainfall_intensity")
+    plants_density = max(0, min(100, planet_state.plants_density))
+    rainfall_area = planet_state.rainfall_area
+    asi = planet_state.asi
+    cloud_density = int(planet_state.cloud_density)
+    rainfall_intensity = planet_state.rainfall_intensity
 
     draw_planet(200, rainfall_area,plants_density, asi, cloud_density)
 
     for slider in independent_sliders:
         draw_slider(slider["x"], slider["y"], slider["width"], variables[slider["var"]], slider["label"])
 
-    draw_dependent_variables(dependent_variables)
+    draw_dependent_variables(planet_state.labels)
 
     mouse_pos = pygame.mouse.get_pos()
     is_hovering_default = 50 <= mouse_pos[0] <= 170 and 500 <= mouse_pos[1] <= 540